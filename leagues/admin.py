@@ -1,4 +1,7 @@
+import numpy as np
+
 from django.contrib import admin
+from django.db.models import Count, Max, Q
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from ordered_model.admin import OrderedModelAdmin
@@ -11,6 +14,7 @@ from .models import (
     Period,
     HomeTeamPlayer,
     AwayTeamPlayer,
+    RankingRun,
 )
 
 
@@ -99,7 +103,90 @@ class PlayerAdmin(admin.ModelAdmin):
     ]
 
 
+class RankingRunAdmin(admin.ModelAdmin):
+    list_display = [
+        "created_at",
+        "league",
+        "stage",
+        "method",
+        "batch_size",
+        "matches",
+        "players",
+        "time",
+        "iterations",
+        "evaluations",
+        "gradient_norm",
+        "converged",
+        "maxiter_reached",
+        "rows_changed",
+    ]
+    list_filter = [
+        "method",
+        "converged",
+        "maxiter_reached",
+        "league",
+    ]
+    change_list_template = "leagues/rankingrun_change_list.html"
+    percentiles = [50, 90, 99]
+    # The statistics are computed over this many most recent (filtered) runs
+    statistics_window = 1000
+    percentile_fields = [
+        "time",
+        "iterations",
+        "evaluations",
+        "matches",
+        "players",
+        "rows_changed",
+    ]
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context=extra_context)
+        try:
+            runs = response.context_data["cl"].queryset
+        except (AttributeError, KeyError):
+            # E.g., a redirect because of invalid filters
+            return response
+
+        # Bound the statistics to the recent runs. Filter by the creation time
+        # of the oldest run in the window instead of slicing, so the queryset
+        # can still be aggregated.
+        oldest = (
+            runs.order_by("-created_at")
+            .values_list("created_at", flat=True)[self.statistics_window - 1:]
+            .first()
+        )
+        if oldest is not None:
+            runs = runs.filter(created_at__gte=oldest)
+
+        values = np.array(
+            list(runs.values_list(*self.percentile_fields)),
+            dtype=float,
+        ).reshape((-1, len(self.percentile_fields)))
+        response.context_data["percentiles"] = self.percentiles
+        response.context_data["statistics_runs"] = len(values)
+        response.context_data["percentile_rows"] = (
+            [] if len(values) == 0 else
+            [
+                # Runs recorded before some fields were added have nulls
+                (field, np.nanpercentile(values[:, i], self.percentiles))
+                for (i, field) in enumerate(self.percentile_fields)
+            ]
+        )
+        # The leagues with the slowest calculations
+        response.context_data["slowest_leagues"] = (
+            runs.values("league__title")
+            .annotate(
+                runs=Count("pk"),
+                time_maximum=Max("time"),
+                maxiter_reached_count=Count("pk", filter=Q(maxiter_reached=True)),
+            )
+            .order_by("-time_maximum")[:10]
+        )
+        return response
+
+
 admin.site.register(League, LeagueAdmin)
 admin.site.register(Stage, StageAdmin)
 admin.site.register(Player, PlayerAdmin)
 admin.site.register(Match, MatchAdmin)
+admin.site.register(RankingRun, RankingRunAdmin)
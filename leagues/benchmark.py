@@ -0,0 +1,142 @@
+"""Synthetic leagues for benchmarking the ranking calculations"""
+
+import time
+import platform
+import datetime
+import tracemalloc
+import subprocess
+
+import numpy as np
+import scipy
+from scipy.stats import spearmanr
+
+from . import ranking
+
+
+# Benchmark cases: (players, matches, team size, regularisation)
+SUITES = dict(
+    quick=[
+        (10, 100, 1, 1),
+        (100, 1000, 1, 1),
+        (100, 1000, 2, 1),
+        (1000, 10000, 1, 1),
+        (1000, 10000, 2, 1),
+    ],
+    full=[
+        (10, 100, 1, 1),
+        (10, 100, 2, 1),
+        (100, 1000, 1, 1),
+        (100, 1000, 2, 1),
+        (100, 1000, 2, 0.1),
+        (100, 1000, 2, 10),
+        (1000, 10000, 1, 1),
+        (1000, 10000, 2, 1),
+        (1000, 50000, 2, 1),
+        (4000, 60000, 2, 1),
+        (10000, 200000, 1, 1),
+        (10000, 200000, 2, 1),
+    ],
+)
+
+
+def synthetic_league(n_players, n_matches, team_size=1, seed=0):
+    """Generate random matches between players with known ranking scores
+
+    Returns the matches in the format accepted by `ranking.calculate_ranking`
+    and the true raw ranking scores of the players.
+
+    """
+    rng = np.random.default_rng(seed)
+    x = rng.normal(0, 1, size=n_players)
+
+    # Choose distinct players for each match by re-drawing the matches that
+    # have some player twice
+    ps = rng.integers(n_players, size=(n_matches, 2*team_size))
+    while True:
+        s = np.sort(ps, axis=-1)
+        invalid = np.any(s[:, 1:] == s[:, :-1], axis=-1)
+        if not np.any(invalid):
+            break
+        ps[invalid] = rng.integers(n_players, size=(np.count_nonzero(invalid), 2*team_size))
+    home = ps[:, :team_size]
+    away = ps[:, team_size:]
+
+    p = 1 / (1 + np.exp(np.mean(x[away], axis=-1) - np.mean(x[home], axis=-1)))
+    # Total points in a match vary a bit
+    n = rng.integers(21, 43, size=n_matches)
+    k = rng.binomial(n, p)
+
+    X = [
+        (list(h), list(a), int(k_home), int(k_away))
+        for (h, a, k_home, k_away) in zip(home.tolist(), away.tolist(), k, n - k)
+    ]
+    return (X, x)
+
+
+def run(n_players, n_matches, team_size=1, regularisation=1, method="newton", seed=0, memory=True):
+    """Benchmark the ranking calculation on a synthetic league
+
+    Returns a dictionary with the timing, the memory peak (if ``memory``), the
+    summary of the calculation and the accuracy of the recovered scores
+    compared to the ground truth.
+
+    """
+    (X, x) = synthetic_league(n_players, n_matches, team_size=team_size, seed=seed)
+
+    t0 = time.perf_counter()
+    (scores, raws, info) = ranking.calculate_ranking(X, n_players, regularisation, method=method)
+    t = time.perf_counter() - t0
+
+    # Measure the memory separately because tracing slows down the calculation
+    memory_peak = None
+    if memory:
+        tracemalloc.start()
+        ranking.calculate_ranking(X, n_players, regularisation, method=method)
+        (_, memory_peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    # Compare to the ground truth. The scale of the scores is shrunk by the
+    # regularisation, so use rank correlation and error after centering.
+    played = np.array([s is not None for s in scores])
+    raws = np.asarray(raws, dtype=float)[played]
+    truth = x[played]
+    error = (raws - np.mean(raws)) - (truth - np.mean(truth))
+
+    return dict(
+        players=n_players,
+        matches=n_matches,
+        team_size=team_size,
+        regularisation=regularisation,
+        method=method,
+        seed=seed,
+        time=t,
+        memory_peak=memory_peak,
+        iterations=info["iterations"],
+        evaluations=info["evaluations"],
+        gradient_norm=info["gradient_norm"],
+        converged=info["converged"],
+        maxiter_reached=info["maxiter_reached"],
+        rank_correlation=float(spearmanr(raws, truth).statistic),
+        rmse=float(np.sqrt(np.mean(error ** 2))),
+    )
+
+
+def environment():
+    """Information for comparing benchmark results across commits"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(
+        commit=commit,
+        datetime=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        scipy=scipy.__version__,
+        machine=platform.machine(),
+    )
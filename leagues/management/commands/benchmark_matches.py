@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from leagues import models
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the match queries on synthetic leagues. The leagues are "
+        "created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--matches", type=int, nargs="+", default=[1000, 10000])
+        parser.add_argument("--players", type=int, default=50)
+        parser.add_argument("--repeats", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'matches':>8} {'single-pass (s)':>16} {'subqueries (s)':>16}"
+        )
+        for n_matches in options["matches"]:
+            try:
+                with transaction.atomic():
+                    league = create_league(
+                        n_matches,
+                        options["players"],
+                        seed=options["seed"],
+                    )
+                    times = [
+                        min(
+                            time_query(getattr(league.match_set, method))
+                            for _ in range(options["repeats"])
+                        )
+                        for method in ["with_total_points", "with_total_points_subqueries"]
+                    ]
+                    raise Rollback()
+            except Rollback:
+                pass
+            self.stdout.write(
+                f"{n_matches:>8} {times[0]:>16.3f} {times[1]:>16.3f}"
+            )
+
+
+def time_query(with_total_points):
+    t0 = time.perf_counter()
+    list(with_total_points(user=None, next_up=None))
+    return time.perf_counter() - t0
+
+
+def create_league(n_matches, n_players, seed=0):
+    """Create a league with random doubles matches of 0-3 periods"""
+    rng = np.random.default_rng(seed)
+    league = models.League.objects.create(
+        slug=f"benchmark-{n_matches}",
+        title="Benchmark",
+    )
+    players = models.Player.objects.bulk_create([
+        models.Player(league=league, name=f"Player {i}", score=rng.normal(20, 5))
+        for i in range(n_players)
+    ])
+    matches = models.Match.objects.bulk_create([
+        models.Match(league=league, order=i)
+        for i in range(n_matches)
+    ])
+    teams = [rng.choice(n_players, size=4, replace=False) for _ in matches]
+    models.HomeTeamPlayer.objects.bulk_create([
+        models.HomeTeamPlayer(match=m, player=players[i])
+        for (m, t) in zip(matches, teams)
+        for i in t[:2]
+    ])
+    models.AwayTeamPlayer.objects.bulk_create([
+        models.AwayTeamPlayer(match=m, player=players[i])
+        for (m, t) in zip(matches, teams)
+        for i in t[2:]
+    ])
+    models.Period.objects.bulk_create([
+        models.Period(
+            match=m,
+            home_points=int(rng.integers(0, 22)),
+            away_points=int(rng.integers(0, 22)),
+        )
+        for m in matches
+        for _ in range(rng.integers(0, 4))
+    ])
+    # Bulk creation doesn't update the summaries
+    models.rebuild_match_summaries(matches)
+    return league
@@ -0,0 +1,101 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from leagues import benchmark
+
+
+class Command(BaseCommand):
+    help = "Benchmark the ranking calculations on synthetic leagues"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--suite",
+            choices=list(benchmark.SUITES),
+            default="quick",
+            help="Predefined set of league sizes (default: quick)",
+        )
+        parser.add_argument(
+            "--players",
+            type=int,
+            nargs="+",
+            help="Number of players, overrides the suite (pairs with --matches)",
+        )
+        parser.add_argument(
+            "--matches",
+            type=int,
+            nargs="+",
+            help="Number of matches, overrides the suite (pairs with --players)",
+        )
+        parser.add_argument("--team-sizes", type=int, nargs="+", default=[1])
+        parser.add_argument("--regularisations", type=float, nargs="+", default=[1])
+        parser.add_argument("--methods", nargs="+", default=["newton"])
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--no-memory",
+            action="store_true",
+            help="Don't measure the memory peak (saves one calculation)",
+        )
+        parser.add_argument(
+            "--json",
+            metavar="FILE",
+            help="Write the results as JSON to the file",
+        )
+
+    def handle(self, *args, **options):
+        if options["players"] is not None or options["matches"] is not None:
+            if (
+                    options["players"] is None or
+                    options["matches"] is None or
+                    len(options["players"]) != len(options["matches"])
+            ):
+                raise CommandError("Give as many --players as --matches")
+            cases = [
+                (n_players, n_matches, team_size, regularisation)
+                for (n_players, n_matches) in zip(options["players"], options["matches"])
+                for team_size in options["team_sizes"]
+                for regularisation in options["regularisations"]
+            ]
+        else:
+            cases = benchmark.SUITES[options["suite"]]
+
+        self.stdout.write(
+            f"{'players':>8} {'matches':>8} {'team':>4} {'reg':>6} {'method':>8} "
+            f"{'time (s)':>10} {'memory (MB)':>12} {'nit':>4} {'nfev':>5} "
+            f"{'conv':>5} {'corr':>6} {'rmse':>6}"
+        )
+        results = []
+        for (n_players, n_matches, team_size, regularisation) in cases:
+            for method in options["methods"]:
+                r = benchmark.run(
+                    n_players,
+                    n_matches,
+                    team_size=team_size,
+                    regularisation=regularisation,
+                    method=method,
+                    seed=options["seed"],
+                    memory=not options["no_memory"],
+                )
+                results.append(r)
+                memory = (
+                    "-" if r["memory_peak"] is None else
+                    f"{r['memory_peak'] / 1e6:.1f}"
+                )
+                self.stdout.write(
+                    f"{r['players']:>8} {r['matches']:>8} {r['team_size']:>4} "
+                    f"{r['regularisation']:>6g} {r['method']:>8} {r['time']:>10.3f} "
+                    f"{memory:>12} {r['iterations']:>4} {r['evaluations']:>5} "
+                    f"{str(r['converged']):>5} {r['rank_correlation']:>6.3f} "
+                    f"{r['rmse']:>6.3f}"
+                )
+
+        if options["json"] is not None:
+            with open(options["json"], "w") as f:
+                json.dump(
+                    dict(
+                        environment=benchmark.environment(),
+                        results=results,
+                    ),
+                    f,
+                    indent=2,
+                )
@@ -0,0 +1,24 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from leagues import models
+
+
+class Command(BaseCommand):
+    help = "Remove old ranking calculation telemetry"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.RANKING_RUN_RETENTION_DAYS,
+            help="Keep the runs of this many last days (default: RANKING_RUN_RETENTION_DAYS setting)",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options["days"])
+        (n, _) = models.RankingRun.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(f"Removed {n} ranking runs")
@@ -0,0 +1,53 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from leagues import models
+from leagues import views
+
+
+class Command(BaseCommand):
+    help = "Recompute the rankings requested in the background (RANKING_BACKGROUND setting)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait between polls when there are no jobs (default: 1)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process the pending jobs and exit",
+        )
+
+    def handle(self, *args, **options):
+        # NOTE: Run only one worker. The jobs aren't locked, so multiple workers
+        # could process the same job.
+        failed = set()
+        while True:
+            jobs = models.RankingJob.objects.select_related("league")
+            if options["once"]:
+                # Failed jobs are retried in the next run
+                jobs = jobs.exclude(pk__in=failed)
+            job = jobs.first()
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
+                continue
+            try:
+                views.process_ranking_job(job)
+            except Exception:
+                logging.exception(f"Failed to update rankings of {job.league.slug}")
+                # Move the job to the end of the queue so that it doesn't block
+                # the other leagues
+                models.RankingJob.objects.filter(pk=job.pk).update(
+                    requested_at=timezone.now(),
+                )
+                failed.add(job.pk)
+            else:
+                self.stdout.write(f"Updated rankings of {job.league.slug}")
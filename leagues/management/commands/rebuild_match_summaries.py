@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from leagues import models
+
+
+class Command(BaseCommand):
+    help = "Recompute the period summaries of the matches and the player statistics"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "leagues",
+            nargs="*",
+            help="League slugs (default: all leagues)",
+        )
+
+    def handle(self, *args, **options):
+        leagues = models.League.objects.all()
+        if options["leagues"]:
+            leagues = leagues.filter(slug__in=options["leagues"])
+        for league in leagues:
+            models.rebuild_match_summaries(league.match_set.all())
+            models.refresh_player_stats(
+                league.player_set.values_list("pk", flat=True)
+            )
+            self.stdout.write(f"Rebuilt match summaries and player statistics of {league.slug}")
@@ -0,0 +1,67 @@
+import os
+import concurrent.futures
+
+from django.core.management.base import BaseCommand
+
+from leagues import models
+from leagues import ranking
+from leagues import views
+
+
+class Command(BaseCommand):
+    help = "Recompute the rankings of all leagues and their stages"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "leagues",
+            nargs="*",
+            help="League slugs (default: all leagues)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes (default: number of CPUs)",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Recompute also the rankings whose input hasn't changed",
+        )
+
+    def handle(self, *args, **options):
+        leagues = models.League.objects.all()
+        if options["leagues"]:
+            leagues = leagues.filter(slug__in=options["leagues"])
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            # Read the data in this process and send only plain data to the
+            # workers. Each league is fitted as one batch.
+            futures = {}
+            for league in leagues:
+                (players, stages, problems, hashes) = views.load_rankings(
+                    league,
+                    league.stage_set.all(),
+                    force=options["force"],
+                )
+                if len(problems) == 0:
+                    self.stdout.write(f"Rankings of {league.slug} are up to date")
+                    continue
+                future = executor.submit(
+                    ranking.calculate_rankings,
+                    [(X, len(ps), r0) for (ps, X, r0) in problems],
+                    league.regularisation,
+                )
+                futures[future] = (league, players, stages, problems, hashes)
+
+            for future in concurrent.futures.as_completed(futures):
+                (league, players, stages, problems, hashes) = futures[future]
+                views.save_rankings(
+                    league,
+                    players,
+                    stages,
+                    problems,
+                    future.result(),
+                    hashes,
+                )
+                self.stdout.write(f"Updated rankings of {league.slug}")
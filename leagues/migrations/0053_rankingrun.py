@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leagues', '0052_rankingscore_score_raw'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('method', models.CharField(max_length=20)),
+                ('batch_size', models.PositiveIntegerField(default=1)),
+                ('matches', models.PositiveIntegerField()),
+                ('players', models.PositiveIntegerField()),
+                ('time', models.FloatField()),
+                ('iterations', models.PositiveIntegerField()),
+                ('evaluations', models.PositiveIntegerField()),
+                ('gradient_norm', models.FloatField(blank=True, default=None, null=True)),
+                ('converged', models.BooleanField()),
+                ('maxiter_reached', models.BooleanField()),
+                ('league', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='leagues.league')),
+                ('stage', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='leagues.stage')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
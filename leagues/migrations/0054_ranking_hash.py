@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leagues', '0053_rankingrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='league',
+            name='ranking_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='stage',
+            name='ranking_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
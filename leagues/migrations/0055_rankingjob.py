@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leagues', '0054_ranking_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('requested_at', models.DateTimeField(auto_now=True)),
+                ('league', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='leagues.league')),
+                ('stages', models.ManyToManyField(blank=True, to='leagues.stage')),
+            ],
+            options={
+                'ordering': ['requested_at'],
+            },
+        ),
+    ]
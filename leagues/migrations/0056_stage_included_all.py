@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:27
+
+from django.db import migrations, models
+
+
+def create_inclusion_closure(apps, schema_editor):
+    """Fill the transitive closure of the existing stage inclusions"""
+    Stage = apps.get_model('leagues', 'Stage')
+    for stage in Stage.objects.all():
+        visited = set()
+        stack = list(stage.included.all())
+        while stack:
+            s = stack.pop()
+            if s.pk == stage.pk or s.pk in visited:
+                continue
+            visited.add(s.pk)
+            stack.extend(s.included.all())
+        stage.included_all.set(visited)
+    return
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leagues', '0055_rankingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stage',
+            name='included_all',
+            field=models.ManyToManyField(blank=True, editable=False, related_name='included_by_all', to='leagues.stage'),
+        ),
+        migrations.RunPython(
+            create_inclusion_closure,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Q, Sum
+
+
+def create_match_summaries(apps, schema_editor):
+    """Summarize the periods of the existing matches"""
+    Period = apps.get_model('leagues', 'Period')
+    MatchSummary = apps.get_model('leagues', 'MatchSummary')
+    MatchSummary.objects.bulk_create([
+        MatchSummary(**values)
+        for values in Period.objects.values("match_id").annotate(
+            period_count=Count("pk"),
+            home_periods=Count("pk", filter=Q(home_points__gt=F("away_points"))),
+            away_periods=Count("pk", filter=Q(away_points__gt=F("home_points"))),
+            total_home_points=Sum("home_points"),
+            total_away_points=Sum("away_points"),
+            max_home_points=Max("home_points"),
+            max_away_points=Max("away_points"),
+            datetime_first_period=Min("datetime"),
+            datetime_last_period=Max("datetime"),
+        ).order_by()
+    ])
+    return
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leagues', '0056_stage_included_all'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchSummary',
+            fields=[
+                ('match', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='leagues.match')),
+                ('period_count', models.PositiveIntegerField(default=0)),
+                ('home_periods', models.PositiveIntegerField(default=0)),
+                ('away_periods', models.PositiveIntegerField(default=0)),
+                ('total_home_points', models.PositiveIntegerField(default=None, null=True)),
+                ('total_away_points', models.PositiveIntegerField(default=None, null=True)),
+                ('max_home_points', models.PositiveIntegerField(default=None, null=True)),
+                ('max_away_points', models.PositiveIntegerField(default=None, null=True)),
+                ('datetime_first_period', models.DateTimeField(default=None, null=True)),
+                ('datetime_last_period', models.DateTimeField(default=None, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['datetime_last_period'], name='leagues_mat_datetim_4413b0_idx')],
+            },
+        ),
+        migrations.RunPython(
+            create_match_summaries,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
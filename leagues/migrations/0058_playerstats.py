@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def create_player_stats(apps, schema_editor):
+    """Compute the statistics of the existing players"""
+    PlayerStats = apps.get_model('leagues', 'PlayerStats')
+    Stage = apps.get_model('leagues', 'Stage')
+    # The stage statistics contain the matches of the included stages too
+    including = {pk: [pk] for pk in Stage.objects.values_list("pk", flat=True)}
+    for (stage_id, including_id) in Stage.included_all.through.objects.values_list(
+            "to_stage_id",
+            "from_stage_id",
+    ):
+        including[stage_id].append(including_id)
+    points = {}
+    for (name, won, lost) in [
+            ('HomeTeamPlayer', 'home', 'away'),
+            ('AwayTeamPlayer', 'away', 'home'),
+    ]:
+        rows = apps.get_model('leagues', name).objects.values_list(
+            "player_id",
+            "match__stage_id",
+        ).annotate(
+            won=Sum(f"match__summary__total_{won}_points", default=0),
+            lost=Sum(f"match__summary__total_{lost}_points", default=0),
+        ).order_by()
+        for (player_id, stage_id, x, y) in rows:
+            stages = [None] + including.get(stage_id, [])
+            for key in [(player_id, stage) for stage in stages]:
+                (x0, y0) = points.get(key, (0, 0))
+                points[key] = (x0 + x, y0 + y)
+    PlayerStats.objects.bulk_create([
+        PlayerStats(
+            player_id=player_id,
+            stage_id=stage_id,
+            points_won=x,
+            points_lost=y,
+            points_played=x + y,
+            point_win_percentage=None if x + y == 0 else 100.0 * x / (x + y),
+        )
+        for ((player_id, stage_id), (x, y)) in points.items()
+    ])
+    return
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leagues', '0057_matchsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points_won', models.PositiveIntegerField(default=0)),
+                ('points_lost', models.PositiveIntegerField(default=0)),
+                ('points_played', models.PositiveIntegerField(default=0)),
+                ('point_win_percentage', models.FloatField(default=None, null=True)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='leagues.player')),
+                ('stage', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='leagues.stage')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('player', 'stage'), name='unique_player_stats_in_stage'), models.UniqueConstraint(condition=models.Q(('stage__isnull', True)), fields=('player',), name='unique_player_stats_in_league')],
+            },
+        ),
+        migrations.RunPython(
+            create_player_stats,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
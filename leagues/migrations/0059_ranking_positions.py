@@ -0,0 +1,118 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:34
+
+from bisect import bisect_left, bisect_right
+
+from django.db import migrations, models
+
+
+def ranking_positions(scores):
+    """Positions of the players as ``(position, tied, count_total, relative)``
+
+    A frozen copy of `leagues.ranking.ranking_positions` at the time of this
+    migration. None for the players without a score.
+
+    """
+    v = sorted(x for x in scores if x is not None)
+    n = len(v)
+    positions = []
+    for x in scores:
+        if x is None:
+            positions.append(None)
+            continue
+        above = n - bisect_right(v, x)
+        below = bisect_left(v, x)
+        positions.append((
+            1 + above,
+            n - above - below > 1,
+            n,
+            100 * (1 - above / max(n - 1, 1)),
+        ))
+    return positions
+
+
+def store_ranking_positions(apps, schema_editor):
+    """Compute the positions of the existing rankings"""
+    League = apps.get_model('leagues', 'League')
+    Player = apps.get_model('leagues', 'Player')
+    Stage = apps.get_model('leagues', 'Stage')
+    RankingScore = apps.get_model('leagues', 'RankingScore')
+    for (Model, objects, fields) in [
+            (
+                Player,
+                lambda league: Player.objects.filter(league=league),
+                [
+                    "ranking_position",
+                    "ranking_position_tied",
+                    "ranking_count_total",
+                    "ranking_relative_position",
+                ],
+            ),
+            (
+                RankingScore,
+                lambda stage: RankingScore.objects.filter(stage=stage),
+                ["position", "position_tied", "count_total", "relative_position"],
+            ),
+    ]:
+        groups = League.objects.all() if Model is Player else Stage.objects.all()
+        for group in groups:
+            objs = list(objects(group))
+            for (obj, position) in zip(objs, ranking_positions([obj.score for obj in objs])):
+                if position is not None:
+                    for (field, value) in zip(fields, position):
+                        setattr(obj, field, value)
+            Model.objects.bulk_update(objs, fields)
+    return
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leagues', '0058_playerstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='player',
+            name='ranking_count_total',
+            field=models.PositiveIntegerField(blank=True, default=None, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='player',
+            name='ranking_position',
+            field=models.PositiveIntegerField(blank=True, default=None, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='player',
+            name='ranking_position_tied',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='player',
+            name='ranking_relative_position',
+            field=models.FloatField(blank=True, default=None, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='rankingscore',
+            name='count_total',
+            field=models.PositiveIntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='rankingscore',
+            name='position',
+            field=models.PositiveIntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='rankingscore',
+            name='position_tied',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='rankingscore',
+            name='relative_position',
+            field=models.FloatField(blank=True, default=None, null=True),
+        ),
+        migrations.RunPython(
+            store_ranking_positions,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
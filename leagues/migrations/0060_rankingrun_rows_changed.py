@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leagues', '0059_ranking_positions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rankingrun',
+            name='rows_changed',
+            field=models.PositiveIntegerField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leagues', '0060_rankingrun_rows_changed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='league',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -5,11 +5,13 @@ import contextvars
 
 import numpy as np
 
-from django.db import models
+from django.db import connection, models, transaction
 from django.utils import timezone
 from django.utils.text import slugify
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from ordered_model.models import OrderedModel, OrderedModelManager
 
 from . import ranking
@@ -75,6 +77,17 @@ class League(models.Model):
         max_length=50,
     )
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    # Hash of the input of the latest ranking calculation. The calculation is
+    # skipped if the input hasn't changed.
+    ranking_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+    )
+    # Incremented whenever something shown on the league pages changes (see
+    # `bump_revision`), so rendered pages can be cached by the revision
+    revision = models.PositiveBigIntegerField(default=0, editable=False)
 
     objects = LeagueManager()
 
@@ -98,6 +111,22 @@ class League(models.Model):
     def natural_key(self):
         return (self.slug,)
 
+    @property
+    def ranking_pending(self):
+        """Whether the rankings are waiting to be recomputed in the background"""
+        return RankingJob.objects.filter(league=self).exists()
+
+    def save(self, *args, **kwargs):
+        # The revision is incremented in the database, so don't overwrite it
+        # with a possibly outdated value
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != "revision"
+            ]
+        super().save(*args, **kwargs)
+        return
+
     def clean(self):
         # Create a key when write-protection is enabled
         if self.write_key is None and self.write_protected:
@@ -119,6 +148,49 @@ class League(models.Model):
         return
 
     def next_up_matches(self):
+        """Primary keys of the matches to be played next on each court
+
+        The result is cached in the instance, so it's evaluated only once per
+        request although the views use it for several match querysets.
+
+        """
+        if not hasattr(self, "_next_up_matches"):
+            self._next_up_matches = (
+                self.next_up_matches_window()
+                if connection.features.supports_over_clause else
+                self.next_up_matches_subqueries()
+            )
+        return self._next_up_matches
+
+    def next_up_matches_window(self):
+        unplayed = self.match_set.with_period_count().filter(
+            period_count=0,
+            datetime_started__isnull=True,
+        )
+        if self.court_set.exists():
+            # Number the unplayed matches on each court (including matches
+            # without a court) and take the first
+            return list(
+                unplayed.annotate(
+                    court_order=models.Window(
+                        models.functions.RowNumber(),
+                        partition_by=models.F("court"),
+                        order_by=models.F("order").asc(),
+                    ),
+                ).filter(
+                    court_order=1,
+                ).values_list("pk", flat=True)
+            )
+        else:
+            return list(
+                unplayed.order_by("order").values_list(
+                    "pk",
+                    flat=True,
+                )[:self.nextup_matches_count]
+            )
+
+    def next_up_matches_subqueries(self):
+        """Fallback for backends without window functions"""
         courts = self.court_set.all()
         if courts.exists():
             # If all database backends supported "distinct on column", we could
@@ -141,7 +213,7 @@ class League(models.Model):
             cs = courts.annotate(
                 next_up=models.Subquery(next_up),
             )
-            return [c.next_up for c in cs] + list(
+            return [c.next_up for c in cs if c.next_up is not None] + list(
                 self.match_set.with_period_count().filter(
                     court=None,
                     period_count=0,
@@ -149,10 +221,15 @@ class League(models.Model):
                 ).order_by("order").values_list("pk", flat=True)[:1]
             )
         else:
-            return self.match_set.with_period_count().filter(
-                period_count=0,
-                datetime_started__isnull=True,
-            ).order_by("order")[:self.nextup_matches_count]
+            return list(
+                self.match_set.with_period_count().filter(
+                    period_count=0,
+                    datetime_started__isnull=True,
+                ).order_by("order").values_list(
+                    "pk",
+                    flat=True,
+                )[:self.nextup_matches_count]
+            )
 
         # return self.match_set.with_period_count().filter(
         #     period_count=0,
@@ -200,6 +277,15 @@ class Stage(OrderedModel):
         symmetrical=False,
         blank=True,
     )
+    # Transitive closure of the included stages. Maintained automatically when
+    # the included stages change, see `update_stage_inclusions`.
+    included_all = models.ManyToManyField(
+        "self",
+        symmetrical=False,
+        blank=True,
+        editable=False,
+        related_name="included_by_all",
+    )
     periods = models.PositiveIntegerField(
         blank=True,
         null=True,
@@ -222,6 +308,13 @@ class Stage(OrderedModel):
     on_dashboard = models.BooleanField(
         default=False,
     )
+    # Hash of the input of the latest ranking calculation, see League
+    ranking_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+    )
 
     objects = StageManager()
 
@@ -254,13 +347,52 @@ class Stage(OrderedModel):
     def get_matches(self, user, next_up=None):
         return Match.objects.with_total_points(user, next_up=next_up).filter(
             models.Q(stage=self) |
-            models.Q(stage__in=self.included.all())
+            models.Q(stage__in=self.included_all.all())
         )
 
     def __str__(self):
         return self.name
 
 
+def stage_inclusion_closure(included):
+    """Find the transitive closure of stage inclusions
+
+    ``included`` maps each stage to the stages it directly includes. Cycles
+    are allowed and a stage isn't included in itself.
+
+    """
+    closure = {}
+    for (stage, children) in included.items():
+        visited = set()
+        stack = list(children)
+        while stack:
+            s = stack.pop()
+            if s == stage or s in visited:
+                continue
+            visited.add(s)
+            stack.extend(included.get(s, []))
+        closure[stage] = visited
+    return closure
+
+
+def update_stage_inclusions(league_id):
+    """Update the transitive closure of the included stages of the league"""
+    included = {pk: [] for pk in Stage.objects.filter(league_id=league_id).values_list("pk", flat=True)}
+    for (from_pk, to_pk) in Stage.included.through.objects.filter(
+            from_stage__league_id=league_id,
+    ).values_list("from_stage_id", "to_stage_id"):
+        included[from_pk].append(to_pk)
+    through = Stage.included_all.through
+    with transaction.atomic():
+        through.objects.filter(from_stage__league_id=league_id).delete()
+        through.objects.bulk_create([
+            through(from_stage_id=from_pk, to_stage_id=to_pk)
+            for (from_pk, to_pks) in stage_inclusion_closure(included).items()
+            for to_pk in to_pks
+        ])
+    return
+
+
 class PlayerManager(models.Manager):
 
     def get_by_natural_key(self, league_slug, uuid):
@@ -269,7 +401,29 @@ class PlayerManager(models.Manager):
             uuid=uuid,
         )
 
-    def with_stats(self):
+    def with_stats(self, stage=None):
+        """Annotate the players with their points in the league or the stage
+
+        The points are read from `PlayerStats`.
+
+        """
+        return self.annotate(
+            selected_stats=models.FilteredRelation(
+                "stats",
+                condition=(
+                    models.Q(stats__stage__isnull=True) if stage is None else
+                    models.Q(stats__stage=stage)
+                ),
+            ),
+        ).annotate(
+            points_won=models.functions.Coalesce("selected_stats__points_won", 0),
+            points_lost=models.functions.Coalesce("selected_stats__points_lost", 0),
+            points_played=models.functions.Coalesce("selected_stats__points_played", 0),
+            point_win_percentage=models.F("selected_stats__point_win_percentage"),
+        )
+
+    def with_stats_subqueries(self):
+        """Reference implementation of `with_stats` for the whole league"""
         # NOTE: Each sum needs to be a separate subquery, otherwise the results
         # will be nonsense (Django issue, I suppose).
         home_points_won = self.annotate(
@@ -340,6 +494,26 @@ class Player(models.Model):
         null=True,
         default=None,
     )
+    # Position in the league ranking, stored when the ranking is calculated
+    ranking_position = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        default=None,
+        editable=False,
+    )
+    ranking_position_tied = models.BooleanField(default=False, editable=False)
+    ranking_count_total = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        default=None,
+        editable=False,
+    )
+    ranking_relative_position = models.FloatField(
+        null=True,
+        blank=True,
+        default=None,
+        editable=False,
+    )
     key = models.CharField(
         null=False,
         blank=False,
@@ -369,22 +543,11 @@ class Player(models.Model):
     def current_ranking_stats(self):
         if self.score is None:
             return None
-        ps = self.league.player_set.exclude(
-            score__isnull=True,
-        )
-        count_above = ps.filter(score__gt=self.score).count()
-        count_below = ps.filter(score__lt=self.score).count()
-        aggs = ps.aggregate(
-            count_total=models.Count("id"),
-            score_minimum=models.Min("score"),
-            score_maximum=models.Max("score"),
-        )
         return dict(
-            count_above=count_above,
-            count_below=count_below,
-            position=1+count_above,
-            relative_position=100*(1-count_above/(aggs["count_total"]-1)),
-            **aggs,
+            position=self.ranking_position,
+            position_tied=self.ranking_position_tied,
+            count_total=self.ranking_count_total,
+            relative_position=self.ranking_relative_position,
         )
 
     def __str__(self):
@@ -433,6 +596,51 @@ def annotate_matches_with_periods(matches):
     )
 
 
+def attach_match_stats(matches):
+    """Calculate the statistics of the matches in one pass
+
+    The matches need to be annotated with `MatchManager.with_total_points`.
+    Returns the matches as a list, each having the statistics cached so that
+    `Match.performance` and friends don't need to calculate them one by one.
+
+    """
+    matches = list(matches)
+    if len(matches) == 0:
+        return matches
+    nan = lambda x: np.nan if x is None else x
+    stats = ranking.batch_match_stats(
+        home_points=[nan(m.total_home_points) for m in matches],
+        away_points=[nan(m.total_away_points) for m in matches],
+        home_scores=[nan(m.home_ranking_score) for m in matches],
+        away_scores=[nan(m.away_ranking_score) for m in matches],
+        points_to_win=[m.points_to_win_actual() for m in matches],
+    )
+    for (i, m) in enumerate(matches):
+        m.stats = {
+            key: tuple(value[i].tolist())
+            for (key, value) in stats.items()
+        }
+    return matches
+
+
+def with_table_relations(matches):
+    """Fetch the related objects that the match tables show
+
+    The players, the periods, the court and the stage are fetched with a fixed
+    number of queries instead of querying them separately for each match.
+
+    """
+    return matches.select_related(
+        "court",
+        "stage",
+        "league",
+    ).prefetch_related(
+        "home_team",
+        "away_team",
+        "period_set",
+    )
+
+
 def group_matches(matches):
     """Group matches to upcoming, ongoing and finished
 
@@ -549,12 +757,100 @@ class MatchManager(OrderedModelManager):
         ).distinct()
 
     def with_period_count(self):
-        return annotate_matches_with_period_count(self)
+        return self.annotate(
+            period_count=models.functions.Coalesce("summary__period_count", 0),
+        )
 
     def with_periods(self):
-        return annotate_matches_with_periods(self)
+        return self.with_period_count().annotate(
+            home_periods=models.functions.Coalesce("summary__home_periods", 0),
+            away_periods=models.functions.Coalesce("summary__away_periods", 0),
+        )
 
     def with_total_points(self, user, next_up, player=None):
+        """Annotate the matches with results, ranking scores and permissions
+
+        Everything is computed in one query grouped over the team players,
+        using `MatchSummary` for the periods, instead of correlated
+        subqueries. See `with_total_points_subqueries` for the reference
+        implementation.
+
+        """
+        if next_up is None:
+            next_up = Match.objects.none()
+        matches = (
+            self if player is None else
+            self.annotate(
+                is_home=models.Exists(
+                    HomeTeamPlayer.objects.filter(match=models.OuterRef("pk"), player=player)
+                ),
+                is_away=models.Exists(
+                    AwayTeamPlayer.objects.filter(match=models.OuterRef("pk"), player=player)
+                ),
+            ).filter(models.Q(is_home=True) | models.Q(is_away=True))
+        )
+        matches_with_user = (
+            None if user is None else
+            None if user == "admin" else
+            Match.objects.filter(
+                models.Q(home_team__uuid=user) |
+                models.Q(away_team__uuid=user)
+            ).values("pk")
+        )
+        can_edit = (
+            # If no user, league needs to be not write-protected
+            models.Case(
+                models.When(league__write_protected=False, then=models.Value(True)),
+                default=models.Value(False),
+            ) if user is None else
+            # Admin can always edit
+            models.Value(True) if user == "admin" else
+            # Otherwise, either not write-protected or user is in the match
+            models.Case(
+                models.When(pk__in=matches_with_user, then=models.Value(True)),
+                default=models.Value(False),
+            )
+        )
+        # The period aggregates are read from the match summaries. The home
+        # and the away players are both joined, so each home player row is
+        # repeated for every away player and vice versa but that doesn't
+        # affect the averages.
+        return matches.annotate(
+            period_count=models.functions.Coalesce("summary__period_count", 0),
+            home_periods=models.functions.Coalesce("summary__home_periods", 0),
+            away_periods=models.functions.Coalesce("summary__away_periods", 0),
+            total_home_points=models.F("summary__total_home_points"),
+            total_away_points=models.F("summary__total_away_points"),
+            bonus=models.Case(
+                models.When(stage__bonus=None, then=models.F("league__bonus")),
+                default=models.F("stage__bonus")
+            ),
+            points_to_win=models.Case(
+                models.When(stage__points_to_win=None, then=models.F("league__points_to_win")),
+                default=models.F("stage__points_to_win"),
+            ),
+            home_ranking_score=models.Avg("home_team__score"),
+            away_ranking_score=models.Avg("away_team__score"),
+            home_bonus=models.F("bonus") * models.F("home_periods"),
+            away_bonus=models.F("bonus") * models.F("away_periods"),
+            datetime_last_period=models.F("summary__datetime_last_period"),
+            datetime_first_period=models.F("summary__datetime_first_period"),
+            max_home_points=models.F("summary__max_home_points"),
+            max_away_points=models.F("summary__max_away_points"),
+            can_edit=can_edit,
+            can_start=models.Case(
+                models.When(pk__in=next_up, then=models.Value(True)),
+                default=models.Value(False),
+            ),
+        ).order_by(
+            "stage",
+            models.F("datetime_last_period").desc(nulls_first=True),
+            models.F("datetime_started").desc(nulls_first=True),
+            "order",
+        )  # Meta.ordering not obeyed, so sort explicitly
+
+    def with_total_points_subqueries(self, user, next_up, player=None):
+        """Reference implementation of `with_total_points` with subqueries"""
         if next_up is None:
             next_up = Match.objects.none()
         # NOTE: Multiple annotations yield wrong results. So, we need to use a
@@ -784,6 +1080,8 @@ class Match(OrderedModel):
         )
 
     def surprisingness(self):
+        if hasattr(self, "stats"):
+            return self.stats["surprisingness"]
         (p, _) = ranking.scores_to_p_and_q(
             self.home_ranking_score,
             self.away_ranking_score,
@@ -804,6 +1102,8 @@ class Match(OrderedModel):
         )
 
     def expected_points(self):
+        if hasattr(self, "stats"):
+            return self.stats["expected_points"]
         return ranking.score_to_result(
             self.home_ranking_score,
             self.away_ranking_score,
@@ -819,6 +1119,8 @@ class Match(OrderedModel):
         )
 
     def expected_point_win_percentages(self):
+        if hasattr(self, "stats"):
+            return self.stats["point_win_percentages"]
         (p, q) = ranking.scores_to_p_and_q(
             self.home_ranking_score,
             self.away_ranking_score,
@@ -826,6 +1128,8 @@ class Match(OrderedModel):
         return (100 * p, 100 * q)
 
     def period_win_probabilities(self):
+        if hasattr(self, "stats"):
+            return self.stats["period_win_probabilities"]
         return ranking.scores_to_period_probabilities(
             self.home_ranking_score,
             self.away_ranking_score,
@@ -866,6 +1170,8 @@ class Match(OrderedModel):
                 (np.nan, np.nan),
                 (0, 0, 0, 0),
             )
+        if hasattr(self, "stats"):
+            return (self.stats["performance"], self.stats["stars"])
         p = ranking.result_to_performance(
             self.total_home_points,
             self.total_away_points,
@@ -929,59 +1235,191 @@ class Period(models.Model):
         return (self.home_points, self.away_points)
 
 
-class RankingScoreManager(models.Manager):
+class PlayerStats(models.Model):
+    """Points of a player in the whole league (null stage) or in a stage
 
-    def with_ranking_stats(self, player):
+    The stage statistics contain the matches of the stage and the stages it
+    includes (see `Stage.included_all`), like the stage pages and rankings.
+    Refreshed automatically when results or teams change, see
+    `refresh_player_stats`. A player without statistics hasn't played.
 
-        count_below = Stage.objects.filter(
-            pk=models.OuterRef("stage__pk"),
-        ).annotate(
-            count_below=models.Count(
-                "rankingscore",
-                filter=models.Q(
-                    rankingscore__score__lt=models.OuterRef("score"),
-                )
-            )
-        ).values("count_below")
+    """
+    player = models.ForeignKey(
+        Player,
+        on_delete=models.CASCADE,
+        related_name="stats",
+    )
+    stage = models.ForeignKey(
+        Stage,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        default=None,
+    )
+    points_won = models.PositiveIntegerField(default=0)
+    points_lost = models.PositiveIntegerField(default=0)
+    points_played = models.PositiveIntegerField(default=0)
+    point_win_percentage = models.FloatField(null=True, default=None)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["player", "stage"],
+                name="unique_player_stats_in_stage",
+            ),
+            models.UniqueConstraint(
+                fields=["player"],
+                condition=models.Q(stage__isnull=True),
+                name="unique_player_stats_in_league",
+            ),
+        ]
 
-        count_above = Stage.objects.filter(
-            pk=models.OuterRef("stage__pk"),
-        ).annotate(
-            count_above=models.Count(
-                "rankingscore",
-                filter=models.Q(
-                    rankingscore__score__gt=models.OuterRef("score"),
-                )
-            )
-        ).values("count_above")
 
-        count_total = Stage.objects.filter(
-            pk=models.OuterRef("stage__pk"),
+def refresh_player_stats(player_ids):
+    """Recompute the statistics of the given players from the match summaries"""
+    player_ids = set(player_ids)
+    # The stages that include each stage, including the stage itself
+    including = {
+        pk: [pk]
+        for pk in Stage.objects.filter(
+            league__player__in=player_ids,
+        ).distinct().values_list("pk", flat=True)
+    }
+    for (stage_id, including_id) in Stage.included_all.through.objects.filter(
+            to_stage__league__player__in=player_ids,
+    ).distinct().values_list("to_stage_id", "from_stage_id"):
+        including[stage_id].append(including_id)
+    points = {}
+    for (through, won, lost) in [
+            (HomeTeamPlayer, "home", "away"),
+            (AwayTeamPlayer, "away", "home"),
+    ]:
+        rows = through.objects.filter(
+            player_id__in=player_ids,
+        ).values_list(
+            "player_id",
+            "match__stage_id",
         ).annotate(
-            count_total=models.Count(
-                "rankingscore",
-                filter=models.Q(
-                    rankingscore__score__isnull=False,
-                )
+            won=models.Sum(f"match__summary__total_{won}_points", default=0),
+            lost=models.Sum(f"match__summary__total_{lost}_points", default=0),
+        ).order_by()
+        for (player_id, stage_id, x, y) in rows:
+            stages = [None] + including.get(stage_id, [])
+            for key in [(player_id, stage) for stage in stages]:
+                (x0, y0) = points.get(key, (0, 0))
+                points[key] = (x0 + x, y0 + y)
+    with transaction.atomic():
+        PlayerStats.objects.filter(player_id__in=player_ids).delete()
+        PlayerStats.objects.bulk_create([
+            PlayerStats(
+                player_id=player_id,
+                stage_id=stage_id,
+                points_won=x,
+                points_lost=y,
+                points_played=x + y,
+                point_win_percentage=None if x + y == 0 else 100.0 * x / (x + y),
             )
-        ).values("count_total")
+            for ((player_id, stage_id), (x, y)) in points.items()
+        ])
+    return
 
-        return (
-            self
-            .filter(
-                # Include only stages that contain some matches
-                stage__match__isnull=False,
-                # Interested only in this player
-                player=player,
-                # .. and only if it has a ranking in the stage
-                score__isnull=False,
-            )
-            .distinct()
-            .annotate(
-                count_below=models.Subquery(count_below),
-                count_above=models.Subquery(count_above),
-                count_total=models.Subquery(count_total),
-            )
+
+def get_match_player_ids(match_id):
+    return set(
+        HomeTeamPlayer.objects.filter(match_id=match_id).values_list("player_id", flat=True)
+    ).union(
+        AwayTeamPlayer.objects.filter(match_id=match_id).values_list("player_id", flat=True)
+    )
+
+
+class MatchSummary(models.Model):
+    """Aggregates of the periods of a match
+
+    Maintained automatically when periods are saved or deleted (see
+    `update_match_summary`), so reading matches doesn't need to aggregate the
+    periods. A match without a summary has no periods.
+
+    """
+    match = models.OneToOneField(
+        Match,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="summary",
+    )
+    period_count = models.PositiveIntegerField(default=0)
+    home_periods = models.PositiveIntegerField(default=0)
+    away_periods = models.PositiveIntegerField(default=0)
+    total_home_points = models.PositiveIntegerField(null=True, default=None)
+    total_away_points = models.PositiveIntegerField(null=True, default=None)
+    max_home_points = models.PositiveIntegerField(null=True, default=None)
+    max_away_points = models.PositiveIntegerField(null=True, default=None)
+    datetime_first_period = models.DateTimeField(null=True, default=None)
+    datetime_last_period = models.DateTimeField(null=True, default=None)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["datetime_last_period"]),
+        ]
+
+
+def period_aggregates():
+    return dict(
+        period_count=models.Count("pk"),
+        home_periods=models.Count(
+            "pk",
+            filter=models.Q(home_points__gt=models.F("away_points")),
+        ),
+        away_periods=models.Count(
+            "pk",
+            filter=models.Q(away_points__gt=models.F("home_points")),
+        ),
+        total_home_points=models.Sum("home_points"),
+        total_away_points=models.Sum("away_points"),
+        max_home_points=models.Max("home_points"),
+        max_away_points=models.Max("away_points"),
+        datetime_first_period=models.Min("datetime"),
+        datetime_last_period=models.Max("datetime"),
+    )
+
+
+def update_match_summary(match_id):
+    """Recompute the summary of the periods of a match"""
+    with transaction.atomic():
+        MatchSummary.objects.update_or_create(
+            match_id=match_id,
+            defaults=Period.objects.filter(match_id=match_id).aggregate(
+                **period_aggregates()
+            ),
+        )
+    return
+
+
+def rebuild_match_summaries(matches):
+    """Recompute the summaries of the given matches in bulk"""
+    with transaction.atomic():
+        MatchSummary.objects.filter(match__in=matches).delete()
+        MatchSummary.objects.bulk_create([
+            MatchSummary(**values)
+            for values in Period.objects.filter(match__in=matches).values(
+                "match_id",
+            ).annotate(
+                **period_aggregates()
+            ).order_by()
+        ])
+    return
+
+
+class RankingScoreManager(models.Manager):
+
+    def with_ranking_stats(self, player):
+        # The positions are stored when the rankings are calculated
+        return self.filter(
+            # Include only stages that contain some matches
+            models.Exists(Match.objects.filter(stage=models.OuterRef("stage"))),
+            # Interested only in this player
+            player=player,
+            # .. and only if it has a ranking in the stage
+            score__isnull=False,
         )
 
 class RankingScore(models.Model):
@@ -990,6 +1428,11 @@ class RankingScore(models.Model):
     player = models.ForeignKey(Player, on_delete=models.CASCADE)
     score = models.FloatField(blank=True, null=True, default=None)
     score_raw = models.FloatField(blank=True, null=True, default=None)
+    # Position in the stage ranking, see `ranking.ranking_positions`
+    position = models.PositiveIntegerField(blank=True, null=True, default=None)
+    position_tied = models.BooleanField(default=False)
+    count_total = models.PositiveIntegerField(blank=True, null=True, default=None)
+    relative_position = models.FloatField(blank=True, null=True, default=None)
 
     class Meta:
         ordering = ["stage", "-score", "player__name"]
@@ -1000,10 +1443,214 @@ class RankingScore(models.Model):
             ),
         ]
 
-    @property
-    def position(self):
-        return 1 + self.count_above
 
-    @property
-    def relative_position(self):
-        return 100 * (1 - self.count_above / (self.count_total-1))
+class RankingRun(models.Model):
+    """Telemetry of a ranking calculation"""
+    league = models.ForeignKey(League, on_delete=models.CASCADE)
+    # Null for the league ranking
+    stage = models.ForeignKey(
+        Stage,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        default=None,
+    )
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    method = models.CharField(max_length=20)
+    # Number of rankings fitted together
+    batch_size = models.PositiveIntegerField(default=1)
+    matches = models.PositiveIntegerField()
+    players = models.PositiveIntegerField()
+    # Wall time in seconds
+    time = models.FloatField()
+    iterations = models.PositiveIntegerField()
+    evaluations = models.PositiveIntegerField()
+    gradient_norm = models.FloatField(blank=True, null=True, default=None)
+    converged = models.BooleanField()
+    maxiter_reached = models.BooleanField()
+    # Number of ranking rows written (changed, created or deleted)
+    rows_changed = models.PositiveIntegerField(blank=True, null=True, default=None)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+
+class RankingJobManager(models.Manager):
+
+    def request(self, league, stages):
+        """Mark the rankings of the league and the stages to be recomputed
+
+        Repeated requests are coalesced into one job per league until the
+        worker picks it up.
+
+        """
+        with transaction.atomic():
+            (job, _) = self.get_or_create(league=league)
+            job.stages.add(*stages)
+            # Bump the request time so the worker knows to recompute again if
+            # it's already processing the job
+            job.save()
+            # The pages show that the ranking is being updated
+            bump_revision(pk=league.pk)
+        return job
+
+
+class RankingJob(models.Model):
+    """Pending background recomputation of the rankings of a league
+
+    Processed by the ``ranking_worker`` management command.
+
+    """
+    objects = RankingJobManager()
+    league = models.OneToOneField(League, on_delete=models.CASCADE)
+    # The stages whose rankings are recomputed in addition to the league ranking
+    stages = models.ManyToManyField(Stage, blank=True)
+    requested_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["requested_at"]
+
+
+def refresh_league_player_stats(league_id):
+    refresh_player_stats(
+        Player.objects.filter(league_id=league_id).values_list("pk", flat=True)
+    )
+    return
+
+
+@receiver(m2m_changed, sender=Stage.included.through)
+def stage_included_changed(sender, instance, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        update_stage_inclusions(instance.league_id)
+        # The stage statistics contain the matches of the included stages
+        refresh_league_player_stats(instance.league_id)
+    return
+
+
+@receiver(post_delete, sender=Stage)
+def stage_deleted(sender, instance, origin=None, **kwargs):
+    update_stage_inclusions(instance.league_id)
+    # The stages that included the deleted stage lose its matches. Nothing to
+    # do if the whole league is being deleted.
+    if not is_deleted_from(origin, League):
+        refresh_league_player_stats(instance.league_id)
+    return
+
+
+def is_deleted_from(origin, *classes):
+    """Whether a deletion originated from instances of the given models"""
+    return (
+        isinstance(origin, classes) or
+        getattr(origin, "model", None) in classes
+    )
+
+
+@receiver(post_save, sender=Period)
+def period_saved(sender, instance, raw=False, **kwargs):
+    # Loaded fixtures and imports rebuild the summaries in bulk afterwards
+    if raw:
+        return
+    update_match_summary(instance.match_id)
+    refresh_player_stats(get_match_player_ids(instance.match_id))
+    return
+
+
+@receiver(post_delete, sender=Period)
+def period_deleted(sender, instance, origin=None, **kwargs):
+    # If the periods are deleted because the match is deleted, the summary is
+    # deleted too and the statistics are refreshed when the teams are deleted
+    if is_deleted_from(origin, Period):
+        update_match_summary(instance.match_id)
+        refresh_player_stats(get_match_player_ids(instance.match_id))
+    return
+
+
+@receiver(post_save, sender=Match)
+def match_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # The stage may have changed
+    refresh_player_stats(get_match_player_ids(instance.pk))
+    return
+
+
+@receiver(post_save, sender=HomeTeamPlayer)
+@receiver(post_save, sender=AwayTeamPlayer)
+def team_player_saved(sender, instance, raw=False, **kwargs):
+    # Loaded fixtures and imports refresh the statistics in bulk afterwards
+    if raw:
+        return
+    refresh_player_stats([instance.player_id])
+    return
+
+
+@receiver(post_delete, sender=HomeTeamPlayer)
+@receiver(post_delete, sender=AwayTeamPlayer)
+def team_player_deleted(sender, instance, origin=None, **kwargs):
+    # Don't refresh if the players are being deleted (e.g., the league)
+    if is_deleted_from(origin, Match, HomeTeamPlayer, AwayTeamPlayer):
+        refresh_player_stats([instance.player_id])
+    return
+
+
+@receiver(m2m_changed, sender=HomeTeamPlayer)
+@receiver(m2m_changed, sender=AwayTeamPlayer)
+def team_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        # The players are needed after clearing
+        instance.cleared_player_ids = (
+            [instance.pk] if reverse else
+            list(sender.objects.filter(match=instance).values_list("player_id", flat=True))
+        )
+    elif action == "post_clear":
+        refresh_player_stats(instance.cleared_player_ids)
+    elif action in ("post_add", "post_remove"):
+        refresh_player_stats([instance.pk] if reverse else pk_set)
+    return
+
+
+def bump_revision(**lookup):
+    """Increment the revision of the leagues that match the lookup"""
+    League.objects.filter(**lookup).update(revision=models.F("revision") + 1)
+    return
+
+
+@receiver(post_save, sender=League)
+def league_saved(sender, instance, raw=False, **kwargs):
+    # Imported leagues start from their own revision
+    if raw:
+        return
+    bump_revision(pk=instance.pk)
+    return
+
+
+@receiver(post_save, sender=Match)
+@receiver(post_save, sender=Player)
+@receiver(post_save, sender=Court)
+@receiver(post_save, sender=Stage)
+@receiver(post_delete, sender=Match)
+@receiver(post_delete, sender=Player)
+@receiver(post_delete, sender=Court)
+@receiver(post_delete, sender=Stage)
+def league_content_changed(sender, instance, origin=None, raw=False, **kwargs):
+    # Nothing to do if the whole league is being deleted or imported
+    if not raw and not is_deleted_from(origin, League):
+        bump_revision(pk=instance.league_id)
+    return
+
+
+@receiver(post_save, sender=Period)
+@receiver(post_delete, sender=Period)
+def period_changed(sender, instance, origin=None, raw=False, **kwargs):
+    if not raw and not is_deleted_from(origin, League, Match):
+        bump_revision(match=instance.match_id)
+    return
+
+
+@receiver(m2m_changed, sender=HomeTeamPlayer)
+@receiver(m2m_changed, sender=AwayTeamPlayer)
+def team_revision_changed(sender, instance, action, **kwargs):
+    # Both matches and players belong to a league
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_revision(pk=instance.league_id)
+    return
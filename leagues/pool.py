@@ -0,0 +1,45 @@
+"""Process pool for the ranking calculations
+
+The ranking calculations are CPU-bound NumPy/SciPy work, so they can be sent to
+separate processes. Only plain data (lists and arrays) should be sent to the
+workers, not model instances.
+
+"""
+
+import atexit
+import concurrent.futures
+
+from django.conf import settings
+
+
+_executor = None
+
+
+def get_executor():
+    """Return the shared process pool or None if it hasn't been enabled
+
+    The number of worker processes is given by ``RANKING_WORKERS`` setting.
+
+    """
+    global _executor
+    workers = getattr(settings, "RANKING_WORKERS", 0)
+    if not workers:
+        return None
+    if _executor is None:
+        _executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        atexit.register(_executor.shutdown)
+    return _executor
+
+
+def reset_executor():
+    """Shut down the shared process pool so that the next call creates a new one
+
+    Needed if the pool is broken, e.g., because a worker process was killed.
+
+    """
+    global _executor
+    if _executor is not None:
+        atexit.unregister(_executor.shutdown)
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    return
@@ -1,116 +1,545 @@
+import math
+import itertools
 import functools
 import time
 import logging
 
 import numpy
 from scipy.optimize import minimize
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 from scipy.stats import binom
 
-# Would be nice to use jax instead of autograd but unfortunately it doesn't work
-# on all machines
-import autograd.numpy as np
-from autograd.scipy.special import gammaln, logsumexp
-from autograd import value_and_grad
 
+# Convergence tolerance for the norm of the gradient of the negative
+# log-likelihood
+GTOL = 1e-5
+
+# Maximum number of iterations for each optimization method
+MAXITER = {
+    # Typically converges in less than ten iterations, so this is just a safety
+    # value for degenerate problems (e.g., no regularisation and a player who
+    # has won all points).
+    "newton": 100,
+    # The optimization becomes surprisingly slow. Have some safety value here
+    # so that it won't take way too much time.
+    "bfgs": 50,
+}
+
+
+def team_operator(teams, n_players):
+    """Sparse matrix that averages the ranking scores of the players of a team
+
+    ``teams`` is a list of player index lists. The result is a CSR matrix of
+    shape ``(len(teams), n_players)`` such that ``A @ x`` gives the average
+    ranking score of each team. Only the team slots are stored, so the memory
+    usage doesn't depend on the number of players.
 
-def calculate_ranking(X, n_players, regularisation, initial=np.nan):
     """
-    Format of X:
+    sizes = numpy.fromiter(map(len, teams), dtype=int, count=len(teams))
+    indptr = numpy.concatenate([[0], numpy.cumsum(sizes)])
+    indices = numpy.fromiter(
+        itertools.chain.from_iterable(teams),
+        dtype=int,
+        count=indptr[-1],
+    )
+    data = numpy.repeat(1 / numpy.maximum(sizes, 1), sizes)
+    return csr_matrix((data, indices, indptr), shape=(len(teams), n_players))
 
-    [ ( [HOME_PLAYER_ID], [AWAY_PLAYER_ID], HOME_TEAM_POINTS, AWAY_TEAM_POINTS ) ]
+
+def aggregate_matches(X):
+    """Merge the matches between the same teams by summing up the points
+
+    The negative log-likelihood is linear in the points of each match, so the
+    merged matches give exactly the same objective function as the original
+    ones. The order of the players in a team doesn't matter, and neither does
+    which team played at home (the points are swapped accordingly).
 
     """
+    totals = {}
+    for (home, away, k_home, k_away) in X:
+        home = tuple(sorted(home))
+        away = tuple(sorted(away))
+        if away < home:
+            (home, away, k_home, k_away) = (away, home, k_away, k_home)
+        (h, a) = totals.get((home, away), (0, 0))
+        totals[(home, away)] = (h + k_home, a + k_away)
+    return [
+        (list(home), list(away), k_home, k_away)
+        for ((home, away), (k_home, k_away)) in totals.items()
+    ]
+
+
+def negloglikelihood(x, A, k_home, k_away, regularisation):
+    """Negative log-likelihood and its gradient
+
+    ``A`` is the difference of the home and away team operators (see
+    `team_operator`), so ``A @ x`` gives the ranking score differences of the
+    teams in each match.
 
-    if n_players == 0:
-        return ([], [])
+    """
+    d = A @ x
+    # Log-probabilities that the home (p) or the away (q) team wins a point
+    logp = -numpy.logaddexp(0, -d)
+    logq = -numpy.logaddexp(0, d)
+    # The "imaginary" player for regularisation purposes has a fixed ranking
+    # score 0.
+    logp_reg = -numpy.logaddexp(0, -x)
+    logq_reg = -numpy.logaddexp(0, x)
+    f = (
+        -numpy.sum(k_home*logp + k_away*logq)
+        # Regularisation: Add an "imaginary" player against whom all players
+        # have played 1v1 match with result 1-1, or actually, x-x where x is
+        # the given regularisation parameter. Note that it doesn't need to be
+        # integer.
+        -numpy.sum(regularisation*logp_reg + regularisation*logq_reg)
+    )
+    # Gradient: d(logp)/dd = q and d(logq)/dd = -p
+    df = k_away * numpy.exp(logp) - k_home * numpy.exp(logq)
+    g = A.T @ df + regularisation * (numpy.exp(logp_reg) - numpy.exp(logq_reg))
+    return (f, g)
 
-    if len(X) == 0:
-        nones = [None] * n_players
-        return (nones, nones)
 
-    # Remove matches with zero points
-    X = list(filter(lambda x: x[2] > 0 or x[3] > 0, X))
+def negloglikelihood_weights(x, A, k_home, k_away, regularisation):
+    """Diagonal weights of the Hessian of the negative log-likelihood
 
-    # Parse points
-    k_home = np.array([k for (_, _, k, _) in X])
-    k_away = np.array([k for (_, _, _, k) in X])
-    jss_home = [np.array(xi[0], dtype=int) for xi in X]
-    jss_away = [np.array(xi[1], dtype=int) for xi in X]
-
-    # Form matrices that calculate the average of the relevant ranking scores
-    # when used as np.dot(A,ranking_scores)
-    n_matches = len(X)
-    A_home = np.zeros((n_matches, n_players))
-    A_away = np.zeros((n_matches, n_players))
-    for i in range(n_matches):
-        A_home[i,X[i][0]] = 1 / len(X[i][0])
-        A_away[i,X[i][1]] = 1 / len(X[i][1])
-
-    def negloglikelihood(x):
-        home_x = np.dot(A_home, x)
-        away_x = np.dot(A_away, x)
-        logz = np.logaddexp(home_x, away_x)
-        logp = home_x - logz
-        logq = away_x - logz
-        # The "imaginary" player for regularisation purposes has a fixed ranking
-        # score 0.
-        logz_reg = np.logaddexp(x, 0)
-        logp_reg = x - logz_reg
-        logq_reg = 0 - logz_reg
-        return (
-            -np.sum(k_home*logp + k_away*logq)
-            # Regularisation: Add an "imaginary" player against whom all players
-            # have played 1v1 match with result 1-1, or actually, x-x where x is
-            # the given regularisation parameter. Note that it doesn't need to
-            # be integer.
-            -np.sum(regularisation*logp_reg + regularisation*logq_reg)
+    The Hessian is ``A.T @ diag(w) @ A + diag(w_reg)``, where the weights are
+    the binomial variances ``n*p*q`` of the matches and of the regularisation
+    matches.
+
+    """
+    d = A @ x
+    w = (k_home + k_away) * numpy.exp(-numpy.logaddexp(0, -d) - numpy.logaddexp(0, d))
+    w_reg = 2 * regularisation * numpy.exp(-numpy.logaddexp(0, -x) - numpy.logaddexp(0, x))
+    return (w, w_reg)
+
+
+def negloglikelihood_hessp(x, v, A, k_home, k_away, regularisation):
+    """Product of the Hessian of the negative log-likelihood and a vector
+
+    The Hessian is never formed explicitly.
+
+    """
+    (w, w_reg) = negloglikelihood_weights(x, A, k_home, k_away, regularisation)
+    return A.T @ (w * (A @ v)) + w_reg * v
+
+
+def fit(A, k_home, k_away, regularisation, x0, method="newton"):
+    """Find the maximum likelihood ranking scores
+
+    Two methods are supported:
+
+    - ``"newton"``: Newton conjugate gradient trust-region method with the
+      analytic Hessian-vector products. Converges to the tolerance in a few
+      iterations.
+
+    - ``"bfgs"``: Quasi-Newton method using only the gradient. This is the
+      original method, kept for comparison.
+
+    """
+    args = (A, k_home, k_away, regularisation)
+    if method == "newton":
+        return minimize(
+            negloglikelihood,
+            x0=x0,
+            args=args,
+            jac=True,
+            hessp=negloglikelihood_hessp,
+            method="trust-ncg",
+            options=dict(
+                gtol=GTOL,
+                maxiter=MAXITER[method],
+            ),
+        )
+    elif method == "bfgs":
+        return minimize(
+            negloglikelihood,
+            x0=x0,
+            args=args,
+            jac=True,
+            method="BFGS",
+            options=dict(
+                gtol=GTOL,
+                maxiter=MAXITER[method],
+            )
         )
+    else:
+        raise ValueError(f"Unknown method: {method}")
 
-    # Construct the initial array
-    x0 = np.broadcast_to(initial, (n_players,))
-    x0 = np.nan_to_num(x0, nan=0.0)
 
-    logging.info("Calculating rankings..")
+def _fit_component(args):
+    # Module-level function so that it can be sent to process pools
     t0 = time.monotonic()
-    res = minimize(
-        value_and_grad(negloglikelihood),
-        x0=x0,
-        jac=True,
-        method="BFGS",  # default anyway
-        options=dict(
-            # The optimization becomes surprisingly slow. Have some safety value
-            # here so that it won't take way too much time. But perhaps the
-            # optimization should be optimized...
-            maxiter=50,
+    res = fit(*args)
+    res.time = time.monotonic() - t0
+    return res
+
+
+def group_indices(labels, n):
+    """Split indices into groups by their labels"""
+    order = numpy.argsort(labels, kind="stable")
+    return numpy.split(order, numpy.cumsum(numpy.bincount(labels, minlength=n))[:-1])
+
+
+def fit_components(A, k_home, k_away, regularisation, x0, method="newton", executor=None):
+    """Fit the independent groups of players separately
+
+    Players who have never played against or with each other, not even via
+    other players, don't affect each other's ranking scores. So, the problem
+    splits into blocks that can be solved separately, in parallel if an
+    ``executor`` (e.g., `concurrent.futures.ProcessPoolExecutor`) is given.
+    Blocks that are already at the optimum, because nothing has changed since
+    the initial values were computed, are skipped.
+
+    Returns the raw scores and the optimization results of the solved blocks.
+    Each result also contains the indices of the players of the block
+    (``players``) and the wall time of the fit (``time``).
+
+    """
+    x = numpy.array(x0, dtype=float)
+    (n_players,) = numpy.shape(x)
+
+    # Players are connected if they've played in the same match
+    B = abs(A)
+    (n, labels) = connected_components(B.T @ B, directed=False)
+
+    # The component of each match (rows that cancelled out completely, e.g., a
+    # player against themselves, don't contribute anything)
+    rows = numpy.flatnonzero(numpy.diff(A.indptr) > 0)
+    row_labels = labels[A.indices[A.indptr[rows]]]
+    row_groups = group_indices(row_labels, n)
+    player_groups = group_indices(labels, n)
+
+    # Players without any matches: only the regularisation affects them
+    has_matches = numpy.bincount(row_labels, minlength=n) > 0
+    if regularisation > 0:
+        x[~has_matches[labels]] = 0
+
+    # Skip components that are already at the optimum
+    g = negloglikelihood(x, A, k_home, k_away, regularisation)[1]
+    gnorm = numpy.sqrt(numpy.bincount(labels, weights=g**2, minlength=n))
+    components = numpy.flatnonzero(has_matches & (gnorm >= GTOL))
+
+    problems = [
+        (
+            A[rows[row_groups[c]]][:, player_groups[c]],
+            k_home[rows[row_groups[c]]],
+            k_away[rows[row_groups[c]]],
+            regularisation,
+            x[player_groups[c]],
+            method,
         )
+        for c in components
+    ]
+    results = list(
+        map(_fit_component, problems) if executor is None else
+        executor.map(_fit_component, problems)
     )
-    t = time.monotonic() - t0
-    logging.info(f"Ranking calculations completed in {t} seconds, nfev={res.nfev}: {res.message}")
+    for (c, res) in zip(components, results):
+        x[player_groups[c]] = res.x
+        res.players = player_groups[c]
+
+    logging.info(
+        f"Solved {len(components)} out of {numpy.count_nonzero(has_matches)} "
+        f"player groups"
+    )
+    return (x, results)
+
+
+def parse_matches(X, n_players):
+    """Form the likelihood terms of the matches
+
+    Returns the difference operator of the team scores, the points of the home
+    and away teams, and a boolean array telling which players have played.
+    Matches with zero points are ignored and repeated pairings are merged.
 
+    """
+    # Remove matches with zero points
+    X = list(filter(lambda x: x[2] > 0 or x[3] > 0, X))
+
+    # Repeated pairings are sufficient statistics, so fit only one row for each
+    X = aggregate_matches(X)
+
+    # Parse points
+    k_home = numpy.array([k for (_, _, k, _) in X], dtype=float)
+    k_away = numpy.array([k for (_, _, _, k) in X], dtype=float)
+
+    # Form sparse matrices that calculate the average of the relevant ranking
+    # scores when used as A_home @ ranking_scores. The likelihood depends only
+    # on the difference of the team scores, so combine them into one operator.
+    A_home = team_operator([xi[0] for xi in X], n_players)
+    A_away = team_operator([xi[1] for xi in X], n_players)
+    A = (A_home - A_away).tocsr()
+
+    played = numpy.zeros(n_players, dtype=bool)
+    played[A_home.indices] = True
+    played[A_away.indices] = True
+
+    return (A, k_home, k_away, played)
+
+
+def fit_info(method, X, n_players, t=0.0, results=None, g=None, batch_size=1, maxiter=None):
+    """Summary of a ranking calculation
+
+    ``results`` are the optimization results and ``g`` is the final gradient.
+    The summary is a dictionary of plain values, so it can be stored as
+    telemetry.
+
+    """
+    if results is None:
+        results = []
+    if maxiter is None:
+        maxiter = MAXITER.get(method)
+    return dict(
+        method=method,
+        batch_size=batch_size,
+        matches=len(X),
+        players=n_players,
+        time=t,
+        iterations=max((res.nit for res in results), default=0),
+        evaluations=sum(res.nfev for res in results),
+        gradient_norm=None if g is None else float(numpy.linalg.norm(g)),
+        converged=all(res.success for res in results),
+        maxiter_reached=any(
+            not res.success and res.nit >= maxiter
+            for res in results
+        ),
+    )
+
+
+def raws_to_scores(x, played):
     # Logarithmic scale scores. Round the scores to 3 decimals because the
     # calculation has numerical inaccuracy anyway, so we don't want to have a
     # different score for players with theoretically equivalen score.
-    scores = list(np.round(10 + 10 * (res.x - numpy.amin(res.x)) / np.log(2), decimals=3))
+    scores = list(numpy.round(10 + 10 * (x - numpy.amin(x)) / numpy.log(2), decimals=3))
     # Linear scale scores
-    #return 10 * np.exp(res.x - numpy.amin(res.x))
+    #return 10 * numpy.exp(x - numpy.amin(x))
 
     # If a player hasn't played at all, put score to None
-    played_ids = functools.reduce(
-        lambda acc, ids: acc.union(ids),
-        jss_home + jss_away,
-        set(),
+    for i in numpy.flatnonzero(~played):
+        scores[i] = None
+
+    return scores
+
+
+def ranking_positions(scores):
+    """Positions of the players in a ranking
+
+    ``scores`` contains None for players without a score. Returns a list of
+    ``(position, tied, count_total, relative_position)`` tuples, or None for
+    the players without a score. Tied players share the best position. The
+    relative position is 100 for the best and 0 for the worst player.
+
+    """
+    s = numpy.array([numpy.nan if x is None else x for x in scores], dtype=float)
+    ranked = ~numpy.isnan(s)
+    v = numpy.sort(s[ranked])
+    n = len(v)
+    above = n - numpy.searchsorted(v, s, side="right")
+    below = numpy.searchsorted(v, s, side="left")
+    tied = n - above - below > 1
+    relative = 100 * (1 - above / max(n - 1, 1))
+    return [
+        (int(1 + a), bool(t), n, float(r)) if ok else None
+        for (ok, a, t, r) in zip(ranked, above, tied, relative)
+    ]
+
+
+def calculate_ranking(X, n_players, regularisation, initial=numpy.nan, method="newton", executor=None):
+    """
+    Format of X:
+
+    [ ( [HOME_PLAYER_ID], [AWAY_PLAYER_ID], HOME_TEAM_POINTS, AWAY_TEAM_POINTS ) ]
+
+    See `fit` for the supported optimization methods and `fit_components` for
+    the executor.
+
+    Returns the ranking scores, the raw scores and a summary of the
+    calculation (see `fit_info`).
+
+    """
+
+    if n_players == 0:
+        return ([], [], fit_info(method, X, n_players))
+
+    if len(X) == 0:
+        nones = [None] * n_players
+        return (nones, nones, fit_info(method, X, n_players))
+
+    (A, k_home, k_away, played) = parse_matches(X, n_players)
+
+    # Construct the initial array
+    x0 = numpy.broadcast_to(initial, (n_players,))
+    x0 = numpy.nan_to_num(x0, nan=0.0)
+
+    logging.info("Calculating rankings..")
+    t0 = time.monotonic()
+    (x, results) = fit_components(
+        A,
+        k_home,
+        k_away,
+        regularisation,
+        x0,
+        method=method,
+        executor=executor,
+    )
+    t = time.monotonic() - t0
+    g = negloglikelihood(x, A, k_home, k_away, regularisation)[1]
+    info = fit_info(method, X, n_players, t=t, results=results, g=g)
+    logging.info(
+        f"Ranking calculations completed in {t} seconds, "
+        f"nit={info['iterations']}, nfev={info['evaluations']}"
     )
 
-    not_played_ids = set(range(n_players)).difference(played_ids)
+    return (raws_to_scores(x, played), x, info)
 
-    for i in not_played_ids:
-        scores[i] = None
 
-    return (scores, res.x)
+def calculate_rankings(problems, regularisation, method="newton", executor=None):
+    """Calculate several independent rankings together
+
+    ``problems`` is a list of ``(X, n_players, initial)`` tuples, see
+    `calculate_ranking`. The problems are stacked into one block-diagonal
+    problem, which is fitted with `fit_components`. So, the connected player
+    groups of all the problems are solved separately (in parallel if an
+    ``executor`` is given) and the groups that are already at the optimum are
+    skipped.
+
+    Returns a list of ``(scores, raws, info)`` tuples, one for each problem.
+    The summaries contain only the fits of the player groups of each problem.
+
+    """
+    sizes = [n for (_, n, _) in problems]
+    offsets = numpy.cumsum([0] + sizes)
+
+    X = [
+        (
+            [offset + i for i in home],
+            [offset + i for i in away],
+            k_home,
+            k_away,
+        )
+        for ((Xi, _, _), offset) in zip(problems, offsets)
+        for (home, away, k_home, k_away) in Xi
+    ]
+    x0 = numpy.concatenate([numpy.zeros(0)] + [
+        numpy.nan_to_num(numpy.broadcast_to(initial, (n,)), nan=0.0)
+        for (_, n, initial) in problems
+    ])
+
+    (A, k_home, k_away, played) = parse_matches(X, offsets[-1])
+
+    logging.info(f"Calculating {len(problems)} rankings..")
+    t0 = time.monotonic()
+    (x, results) = fit_components(
+        A,
+        k_home,
+        k_away,
+        regularisation,
+        x0,
+        method=method,
+        executor=executor,
+    )
+    t = time.monotonic() - t0
+    g = negloglikelihood(x, A, k_home, k_away, regularisation)[1]
+    logging.info(
+        f"Ranking calculations completed in {t} seconds, "
+        f"{len(results)} player groups solved"
+    )
+
+    # The player groups don't cross the problems
+    problem_of_result = numpy.searchsorted(
+        offsets,
+        [res.players[0] for res in results],
+        side="right",
+    ) - 1
+
+    return [
+        ([], [], fit_info(method, Xi, n)) if n == 0 else
+        ([None] * n, [None] * n, fit_info(method, Xi, n)) if len(Xi) == 0 else
+        (
+            raws_to_scores(x[start:end], played[start:end]),
+            x[start:end],
+            fit_info(
+                method,
+                Xi,
+                n,
+                t=sum(res.time for res in results_i),
+                results=results_i,
+                g=g[start:end],
+                batch_size=len(problems),
+            ),
+        )
+        for (i, ((Xi, n, _), start, end)) in enumerate(zip(problems, offsets[:-1], offsets[1:]))
+        for results_i in [[
+            res for (res, j) in zip(results, problem_of_result)
+            if j == i
+        ]]
+    ]
+
+
+# Number of binomial coefficient tables kept in memory. The number of trials is
+# typically a small integer (total points of a match or 2*points_to_win-1), so
+# this covers all of them in practice.
+BINOM_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=BINOM_CACHE_SIZE)
+def binom_table(n):
+    """Log binomial coefficients log(n choose k) for k=0,...,n"""
+    return tuple(
+        math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+        for k in range(n + 1)
+    )
+
+
+def binom_logsum(ks, n, p):
+    """Logarithm of the sum of binomial probabilities of the given k values"""
+    table = binom_table(n)
+    logp = math.log(p)
+    logq = math.log1p(-p)
+    terms = [table[j] + j*logp + (n-j)*logq for j in ks]
+    m = max(terms)
+    return m + math.log(math.fsum(math.exp(t - m) for t in terms))
+
+
+def binom_logcdf(k, n, p):
+    """Logarithm of the binomial CDF using cached coefficient tables
+
+    Equivalent to `scipy.stats.binom.logcdf` for scalar integer k and n but
+    much faster for repeated calls. The evaluation is exact in p.
+
+    """
+    k = int(k)
+    n = int(n)
+    if k < 0:
+        return -math.inf
+    if k >= n or p <= 0:
+        return 0.0
+    if p >= 1:
+        return -math.inf
+    return binom_logsum(range(k + 1), n, p)
+
+
+def binom_logsf(k, n, p):
+    """Logarithm of the binomial survival function, see `binom_logcdf`"""
+    k = int(k)
+    n = int(n)
+    if k < 0:
+        return 0.0
+    if k >= n or p <= 0:
+        return -math.inf
+    if p >= 1:
+        return 0.0
+    return binom_logsum(range(k + 1, n + 1), n, p)
+
+
+def binom_cdf(k, n, p):
+    """Binomial CDF using cached coefficient tables"""
+    return math.exp(binom_logcdf(k, n, p))
 
 
 def score_to_logp(x):
-    return x / 10 * np.log(2)
+    return x / 10 * numpy.log(2)
 
 
 def score_to_p(x):
@@ -120,17 +549,17 @@ def score_to_p(x):
 def scores_to_p(x, y):
     logp = score_to_logp(x)
     logq = score_to_logp(y)
-    logz = np.logaddexp(logp, logq)
-    return np.exp(logp - logz)
+    logz = numpy.logaddexp(logp, logq)
+    return numpy.exp(logp - logz)
 
 
 def scores_to_p_and_q(x, y):
     logp = score_to_logp(x)
     logq = score_to_logp(y)
-    logz = np.logaddexp(logp, logq)
+    logz = numpy.logaddexp(logp, logq)
     return (
-        np.exp(logp - logz),
-        np.exp(logq - logz),
+        numpy.exp(logp - logz),
+        numpy.exp(logq - logz),
     )
 
 
@@ -144,7 +573,7 @@ def score_to_result(x, y, n):
 def scores_to_period_probabilities(x, y, n):
     (p, q) = scores_to_p_and_q(x, y)
     # The opponent doesn't reach n points
-    r = 100*binom.cdf(n-1, 2*n-1, q)
+    r = 100*binom_cdf(n-1, 2*n-1, q)
     return (r, 100-r)
 
 
@@ -156,18 +585,76 @@ def result_to_performance(
 ):
     n = home_points + away_points
     p = scores_to_p(home_ranking_score, away_ranking_score)
-    P0 = 0 if home_points == 0 else binom.cdf(home_points - 1, n, p)
-    P1 = binom.cdf(home_points, n, p)
+    P0 = 0 if home_points == 0 else binom_cdf(home_points - 1, n, p)
+    P1 = binom_cdf(home_points, n, p)
     P = 100 * (P0 + P1) / 2
     return (P, 100-P)
 
 
 def result_to_surprisingness(x, p, n):
-    logP0 = -np.inf if x == 0 else binom.logcdf(x-1, n, p)
-    logP1 = binom.logcdf(x, n, p)
+    logP0 = -numpy.inf if x == 0 else binom_logcdf(x-1, n, p)
+    logP1 = binom_logcdf(x, n, p)
     # Average of the two CDF values.
-    logP = np.logaddexp(logP0, logP1) - np.log(2)
-    # Switch to bits
-    log2P = logP / np.log(2)
-    # Return log-odds
-    return log2P - np.log2(1 - 2**log2P)
+    logP = numpy.logaddexp(logP0, logP1) - numpy.log(2)
+    # Its complement from the survival functions, which is accurate also when
+    # the CDF is close to one
+    logR = numpy.logaddexp(binom_logsf(x-1, n, p), binom_logsf(x, n, p)) - numpy.log(2)
+    # Return log-odds in bits
+    return (logP - logR) / numpy.log(2)
+
+
+def batch_match_stats(home_points, away_points, home_scores, away_scores, points_to_win):
+    """Calculate the statistics of many matches in one vectorized pass
+
+    The arguments are arrays with one element per match. Missing values (no
+    result or no ranking score) are NaN and yield NaN statistics. The results
+    match the values of `score_to_result`, `scores_to_p_and_q`,
+    `scores_to_period_probabilities`, `result_to_performance` and
+    `result_to_surprisingness`, each as an array with the two values of a
+    match on the last axis.
+
+    """
+    x = numpy.asarray(home_points, dtype=float)
+    y = numpy.asarray(away_points, dtype=float)
+    n = numpy.asarray(points_to_win, dtype=float)
+    (p, q) = scores_to_p_and_q(
+        numpy.asarray(home_scores, dtype=float),
+        numpy.asarray(away_scores, dtype=float),
+    )
+    d = score_to_logp(numpy.asarray(home_scores, dtype=float) - numpy.asarray(away_scores, dtype=float))
+
+    # Expected points
+    expected = numpy.where(
+        d >= 0,
+        [n, n * numpy.exp(-d)],
+        [n * numpy.exp(d), n],
+    )
+
+    # Probability that the opponent doesn't reach n points
+    r = 100 * binom.cdf(n - 1, 2*n - 1, q)
+
+    # Mid-point of the CDF of the result. The CDF at -1 is zero.
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        P = 100 * (binom.cdf(x - 1, x + y, p) + binom.cdf(x, x + y, p)) / 2
+        logP = numpy.logaddexp(
+            binom.logcdf(x - 1, x + y, p),
+            binom.logcdf(x, x + y, p),
+        ) - numpy.log(2)
+        logR = numpy.logaddexp(
+            binom.logsf(x - 1, x + y, p),
+            binom.logsf(x, x + y, p),
+        ) - numpy.log(2)
+        s = (logP - logR) / numpy.log(2)
+        t = numpy.log2(P/100) - numpy.log2(1 - P/100)
+    t = numpy.nan_to_num(t, nan=0)
+    home_stars = numpy.clip(numpy.floor(t), 0, 5).astype(int)
+    away_stars = numpy.clip(numpy.floor(-t), 0, 5).astype(int)
+
+    return dict(
+        expected_points=numpy.stack(expected, axis=-1),
+        point_win_percentages=numpy.stack([100 * p, 100 * q], axis=-1),
+        period_win_probabilities=numpy.stack([r, 100 - r], axis=-1),
+        performance=numpy.stack([P, 100 - P], axis=-1),
+        stars=numpy.stack([home_stars, away_stars, away_stars, home_stars], axis=-1),
+        surprisingness=numpy.stack([s, -s], axis=-1),
+    )
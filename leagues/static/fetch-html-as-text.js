@@ -1,7 +1,28 @@
+// ETags and contents of the previously fetched addresses
+const fetchedHtml = {};
+
 /**
+  * Unchanged content isn't downloaded again: the ETag of the previous response
+  * is sent and the previous content is returned if the server answers 304 Not
+  * Modified.
+  *
   * @param {String} url - address for the HTML to fetch
   * @return {String} the resulting HTML string fragment
   */
 async function fetchHtmlAsText(url) {
-    return await (await fetch(url)).text();
+    const previous = fetchedHtml[url];
+    const response = await fetch(url, {
+        // Handle the validation here instead of the browser cache
+        cache: "no-store",
+        headers: previous === undefined ? {} : {"If-None-Match": previous.etag},
+    });
+    if (response.status === 304 && previous !== undefined) {
+        return previous.text;
+    }
+    const text = await response.text();
+    const etag = response.headers.get("ETag");
+    if (etag !== null) {
+        fetchedHtml[url] = {etag: etag, text: text};
+    }
+    return text;
 }
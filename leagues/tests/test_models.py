@@ -1,6 +1,10 @@
+import random
+
+from django.db import connection, models
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 
-from leagues.models import League, Match, Player
+from leagues.models import League, Match, Player, Stage, Court, Period, PlayerStats
 
 
 class SimpleTest(TestCase):
@@ -78,3 +82,187 @@ class MatchTest(TestCase):
             )
 
         return
+
+
+class WithTotalPointsTest(TestCase):
+
+    fields = [
+        "pk",
+        "period_count",
+        "home_periods",
+        "away_periods",
+        "total_home_points",
+        "total_away_points",
+        "bonus",
+        "points_to_win",
+        "home_ranking_score",
+        "away_ranking_score",
+        "home_bonus",
+        "away_bonus",
+        "datetime_last_period",
+        "datetime_first_period",
+        "max_home_points",
+        "max_away_points",
+        "can_edit",
+        "can_start",
+    ]
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.league = League.objects.create(
+            slug="test-league",
+            title="Test League",
+            bonus=1,
+            write_protected=True,
+            write_key="foo",
+        )
+        stage = Stage.objects.create(league=self.league, name="Stage", slug="stage", bonus=3)
+        court = Court.objects.create(league=self.league, name="Court")
+        self.players = [
+            Player.objects.create(league=self.league, name=str(i), score=rng.uniform(0, 30))
+            for i in range(8)
+        ]
+        for i in range(40):
+            m = Match.objects.create(
+                league=self.league,
+                stage=rng.choice([None, stage]),
+                court=rng.choice([None, court]),
+            )
+            # Singles, doubles and uneven teams
+            ps = rng.sample(self.players, rng.choice([2, 3, 4]))
+            n = len(ps) // 2
+            m.home_team.add(*ps[:n])
+            m.away_team.add(*ps[n:])
+            for j in range(rng.choice([0, 0, 1, 2, 3])):
+                Period.objects.create(
+                    match=m,
+                    home_points=rng.randint(0, 21),
+                    away_points=rng.randint(0, 21),
+                )
+        return
+
+    def get_values(self, matches, fields):
+        return [
+            tuple(
+                round(getattr(m, f), 9) if isinstance(getattr(m, f), float) else
+                bool(getattr(m, f)) if f in ("is_home", "is_away") else
+                getattr(m, f)
+                for f in fields
+            )
+            for m in matches
+        ]
+
+    def test_same_as_subqueries(self):
+        next_up = self.league.next_up_matches()
+        for user in [None, "admin", self.players[0].uuid]:
+            for player in [None, self.players[1]]:
+                fields = self.fields + ([] if player is None else ["is_home", "is_away"])
+                kwargs = dict(user=user, next_up=next_up, player=player)
+                self.assertEqual(
+                    self.get_values(self.league.match_set.with_total_points(**kwargs), fields),
+                    self.get_values(self.league.match_set.with_total_points_subqueries(**kwargs), fields),
+                )
+        return
+
+    def test_next_up_matches(self):
+        # Another court that has no matches
+        Court.objects.create(league=self.league, name="Empty court")
+        next_up = self.league.next_up_matches()
+        self.assertEqual(
+            sorted(next_up),
+            sorted(self.league.next_up_matches_subqueries()),
+        )
+        # One for the court and one for the matches without a court
+        self.assertEqual(len(next_up), 2)
+        # Cached in the instance
+        with self.assertNumQueries(0):
+            self.league.next_up_matches()
+
+        # Without courts, the first matches are taken
+        Court.objects.filter(league=self.league).delete()
+        league = League.objects.get(pk=self.league.pk)
+        self.assertEqual(
+            league.next_up_matches_window(),
+            league.next_up_matches_subqueries(),
+        )
+        self.assertEqual(len(league.next_up_matches()), league.nextup_matches_count)
+        return
+
+    def get_stats(self, players):
+        return [
+            (
+                p.pk,
+                p.points_won,
+                p.points_lost,
+                p.points_played,
+                None if p.point_win_percentage is None else round(p.point_win_percentage, 9),
+            )
+            for p in players.order_by("pk")
+        ]
+
+    def test_player_stats(self):
+        players = self.league.player_set
+        Player.objects.create(league=self.league, name="No matches")
+        self.assertEqual(
+            self.get_stats(players.with_stats()),
+            self.get_stats(players.with_stats_subqueries()),
+        )
+
+        # Stage statistics contain only the matches of the stage
+        stage = Stage.objects.get(slug="stage")
+        p = self.players[0]
+        stats = players.with_stats(stage=stage).get(pk=p.pk)
+        won = sum(
+            period.home_points if m.home_team.filter(pk=p.pk).exists() else period.away_points
+            for m in Match.objects.filter(stage=stage).filter(
+                models.Q(home_team=p) | models.Q(away_team=p)
+            ).distinct()
+            for period in m.period_set.all()
+        )
+        self.assertEqual(stats.points_won, won)
+
+        # Stages that include the stage contain its matches too
+        final = Stage.objects.create(league=self.league, name="Final", slug="final")
+        final.included.add(stage)
+        self.assertEqual(
+            self.get_stats(players.with_stats(stage=final)),
+            self.get_stats(players.with_stats(stage=stage)),
+        )
+        final.included.clear()
+        self.assertFalse(PlayerStats.objects.filter(stage=final).exists())
+        final.included.add(stage)
+        stage.delete()
+        self.assertFalse(PlayerStats.objects.filter(stage=final).exists())
+
+        # The statistics follow the changes in the teams, stages and results
+        matches = list(self.league.match_set.filter(period__isnull=False).distinct()[:4])
+        matches[0].home_team.set([self.players[7]])
+        matches[1].away_team.clear()
+        matches[2].stage = None
+        matches[2].save()
+        matches[3].delete()
+        Period.objects.filter(match__in=matches[:2]).first().delete()
+        self.assertEqual(
+            self.get_stats(players.with_stats()),
+            self.get_stats(players.with_stats_subqueries()),
+        )
+        self.assertEqual(
+            PlayerStats.objects.filter(stage=None).count(),
+            len([p for p in self.get_stats(players.with_stats()) if p[3] > 0]),
+        )
+        with CaptureQueriesContext(connection) as context:
+            list(players.with_stats())
+        self.assertEqual(len(context.captured_queries), 1)
+        return
+
+    def test_single_query(self):
+        matches = self.league.match_set.with_total_points(user=None, next_up=None)
+        sql = str(matches.query)
+        self.assertEqual(sql.count("SELECT"), 1)
+        self.assertNotIn("DISTINCT", sql.replace("COUNT(DISTINCT", ""))
+        if connection.vendor == "sqlite":
+            self.assertNotIn("CORRELATED", matches.explain())
+        with CaptureQueriesContext(connection) as context:
+            list(matches)
+        self.assertEqual(len(context.captured_queries), 1)
+        return
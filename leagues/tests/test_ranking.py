@@ -0,0 +1,285 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from numpy import testing
+# Don't use Django's test classes because we don't need that stuff here
+from unittest import TestCase
+
+from leagues import benchmark, ranking
+
+
+def random_matches(n_players, n_matches, team_size=2, seed=0):
+    rng = np.random.default_rng(seed)
+    X = []
+    for i in range(n_matches):
+        ps = rng.permutation(n_players)
+        n = rng.integers(1, team_size + 1)
+        X.append((
+            list(ps[:n]),
+            list(ps[n:2*n]),
+            int(rng.integers(0, 22)),
+            int(rng.integers(0, 22)),
+        ))
+    return X
+
+
+class TestRanking(TestCase):
+
+    def test_team_operator(self):
+        A = ranking.team_operator([[0], [1, 2], [3, 0]], 5)
+        testing.assert_allclose(
+            A.toarray(),
+            np.array([
+                [1, 0, 0, 0, 0],
+                [0, 0.5, 0.5, 0, 0],
+                [0.5, 0, 0, 0.5, 0],
+            ]),
+        )
+        # Only the team slots are stored
+        self.assertEqual(A.nnz, 5)
+        return
+
+    def test_calculate_ranking(self):
+        # A beats B clearly, C hasn't played
+        (scores, raws, info) = ranking.calculate_ranking(
+            [([0], [1], 21, 5), ([1], [0], 10, 21)],
+            3,
+            1.0,
+        )
+        self.assertIsNone(scores[2])
+        self.assertGreater(scores[0], scores[1])
+        self.assertEqual(scores[1], 10)
+        return
+
+    def test_gradient(self):
+        X = random_matches(10, 50)
+        A = (
+            ranking.team_operator([x[0] for x in X], 10) -
+            ranking.team_operator([x[1] for x in X], 10)
+        )
+        k_home = np.array([x[2] for x in X], dtype=float)
+        k_away = np.array([x[3] for x in X], dtype=float)
+        args = (A, k_home, k_away, 0.5)
+        x = np.random.default_rng(1).normal(size=10)
+        v = np.random.default_rng(2).normal(size=10)
+        eps = 1e-6
+        # Compare to finite differences
+        g = ranking.negloglikelihood(x, *args)[1]
+        g_fd = np.array([
+            (
+                ranking.negloglikelihood(x + eps*e, *args)[0] -
+                ranking.negloglikelihood(x - eps*e, *args)[0]
+            ) / (2*eps)
+            for e in np.eye(10)
+        ])
+        testing.assert_allclose(g, g_fd, rtol=1e-5)
+        Hv = ranking.negloglikelihood_hessp(x, v, *args)
+        Hv_fd = (
+            ranking.negloglikelihood(x + eps*v, *args)[1] -
+            ranking.negloglikelihood(x - eps*v, *args)[1]
+        ) / (2*eps)
+        testing.assert_allclose(Hv, Hv_fd, rtol=1e-5)
+        return
+
+    def test_newton(self):
+        X = random_matches(10, 200)
+        (scores, raws, info) = ranking.calculate_ranking(X, 12, 1.0, method="newton")
+        (scores_bfgs, raws_bfgs, _) = ranking.calculate_ranking(X, 12, 1.0, method="bfgs")
+        self.assertTrue(info["converged"])
+        self.assertFalse(info["maxiter_reached"])
+        self.assertLess(info["gradient_norm"], ranking.GTOL)
+        testing.assert_allclose(raws, raws_bfgs, atol=1e-4)
+        self.assertEqual(scores[10:], [None, None])
+        return
+
+    def test_aggregate_matches(self):
+        X = [
+            ([0, 1], [2, 3], 21, 15),
+            ([1, 0], [3, 2], 18, 21),
+            ([2, 3], [0, 1], 21, 10),
+            ([0], [1], 21, 10),
+        ]
+        self.assertEqual(
+            ranking.aggregate_matches(X),
+            [
+                ([0, 1], [2, 3], 49, 57),
+                ([0], [1], 21, 10),
+            ],
+        )
+        # The objective function is exactly the same
+        Y = ranking.aggregate_matches(X)
+        x = np.array([0.1, -0.3, 0.7, 0.2])
+
+        def objective(X):
+            A = (
+                ranking.team_operator([m[0] for m in X], 4) -
+                ranking.team_operator([m[1] for m in X], 4)
+            )
+            return ranking.negloglikelihood(
+                x,
+                A,
+                np.array([m[2] for m in X], dtype=float),
+                np.array([m[3] for m in X], dtype=float),
+                1.0,
+            )
+
+        (f_X, g_X) = objective(X)
+        (f_Y, g_Y) = objective(Y)
+        testing.assert_allclose(f_Y, f_X)
+        testing.assert_allclose(g_Y, g_X)
+        return
+
+    def test_warm_start(self):
+        X = random_matches(20, 60, team_size=1)
+        (scores, raws, info) = ranking.calculate_ranking(X, 20, 1.0)
+
+        # Add results one by one and start each fit from the previous optimum
+        rng = np.random.default_rng(1)
+        for i in range(30):
+            (home, away) = rng.choice(20, size=2, replace=False)
+            X = X + [([int(home)], [int(away)], 21, int(rng.integers(0, 21)))]
+            (scores, raws, info) = ranking.calculate_ranking(X, 20, 1.0, initial=raws)
+            self.assertTrue(info["converged"])
+
+        (scores_full, raws_full, _) = ranking.calculate_ranking(X, 20, 1.0)
+        testing.assert_allclose(raws, raws_full, atol=1e-4)
+        testing.assert_allclose(scores, scores_full, atol=1e-3)
+        return
+
+    def test_fit_components(self):
+        # Two separate groups and one player who hasn't played
+        X = random_matches(10, 100) + [
+            ([10 + i for i in m[0]], [10 + i for i in m[1]], m[2], m[3])
+            for m in random_matches(10, 100, seed=1)
+        ]
+        (A, k_home, k_away, played) = ranking.parse_matches(X, 21)
+        x0 = np.full(21, 0.5)
+        res = ranking.fit(A, k_home, k_away, 1.0, x0)
+        (x, results) = ranking.fit_components(A, k_home, k_away, 1.0, x0)
+        self.assertEqual(len(results), 2)
+        testing.assert_allclose(x, res.x, atol=1e-5)
+
+        # Nothing has changed, so nothing is solved
+        (x_again, results) = ranking.fit_components(A, k_home, k_away, 1.0, x)
+        self.assertEqual(len(results), 0)
+        testing.assert_array_equal(x_again, x)
+
+        # Components can be solved in parallel
+        with ThreadPoolExecutor(2) as executor:
+            (x_parallel, results) = ranking.fit_components(
+                A, k_home, k_away, 1.0, x0, executor=executor,
+            )
+        testing.assert_array_equal(x_parallel, x)
+        return
+
+    def test_calculate_rankings(self):
+        problems = [
+            (random_matches(10, 100), 12, np.nan),
+            ([], 3, np.nan),
+            ([], 0, np.nan),
+            (random_matches(5, 40, seed=1), 5, 0.1),
+        ]
+        results = ranking.calculate_rankings(problems, 1.0)
+        self.assertEqual(len(results), 4)
+        for ((X, n, initial), (scores, raws, _)) in zip(problems, results):
+            (scores_single, raws_single, _) = ranking.calculate_ranking(X, n, 1.0, initial=initial)
+            self.assertEqual(
+                [s is None for s in scores],
+                [s is None for s in scores_single],
+            )
+            testing.assert_allclose(
+                [np.nan if s is None else s for s in scores],
+                [np.nan if s is None else s for s in scores_single],
+                atol=1e-3,
+            )
+        return
+
+    def test_benchmark(self):
+        r = benchmark.run(50, 1000, team_size=2)
+        self.assertTrue(r["converged"])
+        self.assertGreater(r["memory_peak"], 0)
+        # The true ranking is recovered
+        self.assertGreater(r["rank_correlation"], 0.9)
+        return
+
+    def test_batch_match_stats(self):
+        rng = np.random.default_rng(0)
+        x = rng.integers(0, 30, size=20)
+        y = rng.integers(0, 30, size=20)
+        home = rng.uniform(0, 40, size=20)
+        away = rng.uniform(0, 40, size=20)
+        n = rng.integers(11, 22, size=20)
+        stats = ranking.batch_match_stats(x, y, home, away, n)
+        for i in range(20):
+            testing.assert_allclose(
+                stats["expected_points"][i],
+                ranking.score_to_result(home[i], away[i], n[i]),
+            )
+            testing.assert_allclose(
+                stats["point_win_percentages"][i],
+                100 * np.array(ranking.scores_to_p_and_q(home[i], away[i])),
+            )
+            testing.assert_allclose(
+                stats["period_win_probabilities"][i],
+                ranking.scores_to_period_probabilities(home[i], away[i], n[i]),
+                atol=1e-9,
+            )
+            testing.assert_allclose(
+                stats["performance"][i],
+                ranking.result_to_performance(x[i], y[i], home[i], away[i]),
+                atol=1e-9,
+            )
+            p = ranking.scores_to_p(home[i], away[i])
+            testing.assert_allclose(
+                stats["surprisingness"][i, 0],
+                ranking.result_to_surprisingness(x[i], p, x[i] + y[i]),
+            )
+
+        # Missing results
+        stats = ranking.batch_match_stats([np.nan], [np.nan], [10], [12], [21])
+        self.assertTrue(np.all(np.isnan(stats["performance"])))
+        testing.assert_array_equal(stats["stars"], [[0, 0, 0, 0]])
+        return
+
+    def test_binom_logcdf(self):
+        from scipy.stats import binom
+        rng = np.random.default_rng(0)
+        for i in range(200):
+            n = int(rng.integers(0, 60))
+            k = int(rng.integers(-1, n + 2))
+            p = rng.uniform(0.01, 0.99)
+            testing.assert_allclose(
+                ranking.binom_logcdf(k, n, p),
+                binom.logcdf(k, n, p),
+                rtol=1e-10,
+                atol=1e-12,
+            )
+            testing.assert_allclose(
+                ranking.binom_logsf(k, n, p),
+                binom.logsf(k, n, p),
+                rtol=1e-10,
+                atol=1e-12,
+            )
+            testing.assert_allclose(
+                ranking.binom_cdf(k, n, p),
+                binom.cdf(k, n, p),
+                rtol=1e-10,
+                atol=1e-12,
+            )
+        self.assertLessEqual(ranking.binom_table.cache_info().currsize, ranking.BINOM_CACHE_SIZE)
+        return
+
+    def test_ranking_positions(self):
+        self.assertEqual(
+            ranking.ranking_positions([12.0, None, 30.5, 12.0, 10.0]),
+            [
+                (2, True, 4, 100 * (1 - 1/3)),
+                None,
+                (1, False, 4, 100.0),
+                (2, True, 4, 100 * (1 - 1/3)),
+                (4, False, 4, 0.0),
+            ],
+        )
+        self.assertEqual(ranking.ranking_positions([15.0]), [(1, False, 1, 100.0)])
+        self.assertEqual(ranking.ranking_positions([]), [])
+        return
@@ -1,7 +1,24 @@
-from django.test import TestCase, Client
+import datetime
+import io
+import os
+from unittest import mock
 
-from leagues.models import League, Match, Player
-from leagues import views
+import numpy as np
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from django.contrib.auth.models import User
+
+from leagues.models import (
+    League, Match, Player, Period, Stage, RankingScore, RankingRun, RankingJob,
+    MatchSummary, Court, PlayerStats,
+)
+from leagues import models, pool, ranking, views
+from leagues.management.commands.benchmark_matches import create_league
 
 
 class TestCreateEvenMatchRounds(TestCase):
@@ -109,3 +126,712 @@ class TestCreateEvenMatchRounds(TestCase):
 
         return
 
+
+
+class TestUpdateRanking(TestCase):
+
+    def setUp(self):
+        self.league = League.objects.create(
+            slug="test-league",
+            title="Test League",
+        )
+        self.stage = Stage.objects.create(
+            league=self.league,
+            name="Stage",
+            slug="stage",
+        )
+        self.players = [
+            Player.objects.create(league=self.league, name=name)
+            for name in "ABCDEF"
+        ]
+        return
+
+    def create_match(self, home, away, points):
+        m = Match.objects.create(league=self.league, stage=self.stage)
+        m.home_team.add(*home)
+        m.away_team.add(*away)
+        Period.objects.create(match=m, home_points=points[0], away_points=points[1])
+        return m
+
+    def get_raws(self):
+        return (
+            {p.name: p.score_raw for p in Player.objects.filter(league=self.league)},
+            {r.player.name: r.score_raw for r in RankingScore.objects.filter(stage=self.stage)},
+        )
+
+    def test_add_result(self):
+        (A, B, C, D, E, F) = self.players
+        self.create_match([A], [B], (21, 15))
+        self.create_match([B], [C], (21, 17))
+        self.create_match([C], [D], (19, 21))
+        self.create_match([A, D], [B, E], (21, 18))
+        views.update_ranking(self.league, self.stage)
+        (league_before, stage_before) = self.get_raws()
+
+        m = self.create_match([E], [A], (21, 12))
+        views.update_ranking(self.league, self.stage)
+        (league_after, stage_after) = self.get_raws()
+        for (before, after) in [(league_before, league_after), (stage_before, stage_after)]:
+            self.assertGreater(after["E"], before["E"])
+            self.assertLess(after["A"], before["A"])
+
+        # The result is the same as the full recomputation from scratch
+        Player.objects.update(score=None, score_raw=None)
+        RankingScore.objects.all().delete()
+        views.update_league_ranking(self.league)
+        views.update_stage_ranking(self.stage, self.league.regularisation)
+        (league_full, stage_full) = self.get_raws()
+        for (after, full) in [(league_after, league_full), (stage_after, stage_full)]:
+            self.assertEqual(after.keys(), full.keys())
+            for name in after:
+                self.assertAlmostEqual(after[name], full[name], places=4)
+
+        # F hasn't played
+        self.assertIsNone(Player.objects.get(name="F").score)
+        self.assertEqual(RankingScore.objects.filter(stage=self.stage).count(), 5)
+        return
+
+    def test_load_ranking_matches(self):
+        (A, B, C, D, E, F) = self.players
+        self.stage.bonus = 2
+        self.stage.save()
+        self.create_match([A], [B], (21, 15))
+        m = self.create_match([B, C], [D, A], (12, 21))
+        Period.objects.create(match=m, home_points=21, away_points=19)
+        # Matches without results and outside the stage
+        m = Match.objects.create(league=self.league, stage=self.stage)
+        m.home_team.add(E)
+        m.away_team.add(F)
+        m = Match.objects.create(league=self.league)
+        m.home_team.add(C)
+        m.away_team.add(E)
+        Period.objects.create(match=m, home_points=3, away_points=21)
+
+        with self.assertNumQueries(3):
+            (ps, X) = views.load_ranking_matches(views.get_stage_matches(self.stage))
+        self.assertEqual(ps, sorted(p.pk for p in self.players))
+        names = {p.pk: p.name for p in self.players}
+        self.assertEqual(
+            sorted(
+                (
+                    sorted(names[ps[i]] for i in home),
+                    sorted(names[ps[i]] for i in away),
+                    k_home,
+                    k_away,
+                )
+                for (home, away, k_home, k_away) in X
+            ),
+            [
+                (["A"], ["B"], 23, 15),
+                (["B", "C"], ["A", "D"], 35, 42),
+            ],
+        )
+        return
+
+    def test_save_stage_ranking(self):
+        (A, B, C, D, E, F) = self.players
+        self.create_match([A], [B], (21, 15))
+        self.create_match([C], [D], (21, 10))
+        views.update_ranking(self.league, self.stage)
+        pks = dict(RankingScore.objects.values_list("player__name", "pk"))
+
+        # Nothing has changed, so nothing is written
+        ((ps, X, r0),) = views.load_rankings(self.league, [self.stage], force=True)[2][1:]
+        (rs, raws, _) = ranking.calculate_ranking(X, len(ps), self.league.regularisation, initial=r0)
+        with CaptureQueriesContext(connection) as queries:
+            views.save_stage_ranking(self.stage, ps, rs, raws)
+        self.assertFalse(any(
+            q["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+            for q in queries
+        ))
+
+        # Players who left the stage are deleted and the others are updated in
+        # place
+        Match.objects.filter(home_team=C).update(stage=None)
+        self.create_match([A], [E], (21, 19))
+        views.update_ranking(self.league, self.stage)
+        self.assertEqual(
+            dict(RankingScore.objects.values_list("player__name", "pk")),
+            dict(A=pks["A"], B=pks["B"], E=RankingScore.objects.get(player=E).pk),
+        )
+        self.assertEqual(
+            list(RankingScore.objects.values_list("player__name", "position")),
+            [("A", 1), ("E", 2), ("B", 3)],
+        )
+        return
+
+    def test_rows_changed(self):
+        (A, B, C, D, E, F) = self.players
+        self.create_match([A], [B], (21, 15))
+        self.create_match([B], [C], (21, 17))
+        views.update_league_ranking(self.league)
+        views.update_stage_ranking(self.stage, self.league.regularisation)
+
+        # The same ranking isn't written again
+        with CaptureQueriesContext(connection) as queries:
+            views.update_league_ranking(self.league)
+            views.update_stage_ranking(self.stage, self.league.regularisation)
+        self.assertFalse(any(
+            q["sql"].startswith("UPDATE \"leagues_player\"") or
+            q["sql"].startswith("INSERT INTO \"leagues_rankingscore\"")
+            for q in queries
+        ))
+        self.assertEqual(
+            list(RankingRun.objects.order_by("-pk").values_list("rows_changed", flat=True)[:2]),
+            [0, 0],
+        )
+
+        # Changes within the tolerance aren't written either
+        A.refresh_from_db()
+        Player.objects.filter(pk=A.pk).update(score_raw=A.score_raw + 1e-3)
+        with override_settings(RANKING_SCORE_TOLERANCE=1e-2):
+            views.update_league_ranking(self.league)
+        self.assertEqual(RankingRun.objects.first().rows_changed, 0)
+        views.update_league_ranking(self.league)
+        self.assertEqual(RankingRun.objects.first().rows_changed, 1)
+        return
+
+    def test_attach_match_stats(self):
+        (A, B, C, D, E, F) = self.players
+        self.create_match([A], [B], (21, 15))
+        self.create_match([B, C], [D, A], (12, 21))
+        self.create_match([C], [D], (0, 21))
+        Match.objects.create(league=self.league)
+        views.update_ranking(self.league)
+
+        def get_matches():
+            return self.league.match_set.with_total_points(user=None, next_up=None)
+
+        matches = models.attach_match_stats(get_matches())
+        self.assertEqual(len(matches), 4)
+        for (m, expected) in zip(matches, get_matches()):
+            (performance, stars) = m.performance()
+            (expected_performance, expected_stars) = expected.performance()
+            np.testing.assert_allclose(performance, expected_performance)
+            self.assertEqual(tuple(stars), tuple(expected_stars))
+            if expected.has_result():
+                np.testing.assert_allclose(m.surprisingness(), expected.surprisingness())
+                np.testing.assert_allclose(m.expected_points(), expected.expected_points())
+                np.testing.assert_allclose(
+                    m.period_win_probabilities(),
+                    expected.period_win_probabilities(),
+                )
+        return
+
+    def test_batched(self):
+        (A, B, C, D, E, F) = self.players
+        other = Stage.objects.create(league=self.league, name="Other", slug="other")
+        self.create_match([A], [B], (21, 15))
+        self.create_match([B], [C], (21, 17))
+        m = Match.objects.create(league=self.league, stage=other)
+        m.home_team.add(D)
+        m.away_team.add(E)
+        Period.objects.create(match=m, home_points=21, away_points=3)
+
+        views.update_ranking(self.league, self.stage, other)
+        batched = (
+            list(Player.objects.values_list("name", "score")),
+            list(RankingScore.objects.values_list("stage__slug", "player__name", "score")),
+        )
+
+        views.update_league_ranking(self.league)
+        views.update_stage_ranking(self.stage, self.league.regularisation)
+        views.update_stage_ranking(other, self.league.regularisation)
+        separate = (
+            list(Player.objects.values_list("name", "score")),
+            list(RankingScore.objects.values_list("stage__slug", "player__name", "score")),
+        )
+
+        self.assertEqual(batched, separate)
+        return
+
+    @override_settings(RANKING_WORKERS=1)
+    def test_broken_pool(self):
+        (A, B, C, D, E, F) = self.players
+        self.create_match([A], [B], (21, 15))
+        # Kill the worker process
+        executor = pool.get_executor()
+        executor.submit(os._exit, 1)
+        executor.shutdown(wait=True)
+        self.addCleanup(pool.reset_executor)
+
+        # The pool is replaced
+        views.update_ranking(self.league, self.stage)
+        self.assertIsNot(pool.get_executor(), executor)
+        self.assertEqual(RankingScore.objects.count(), 2)
+        return
+
+    def test_update_rankings_command(self):
+        (A, B, C, D, E, F) = self.players
+        self.create_match([A], [B], (21, 15))
+        self.create_match([B, C], [D, E], (21, 17))
+
+        views.update_ranking(self.league, self.stage)
+        expected = (
+            list(Player.objects.values_list("name", "score")),
+            list(RankingScore.objects.values_list("player__name", "score")),
+        )
+
+        # The input hasn't changed, so nothing is recomputed unless forced
+        call_command("update_rankings", workers=2, stdout=io.StringIO())
+        self.assertEqual(RankingRun.objects.count(), 2)
+        call_command("update_rankings", workers=2, force=True, stdout=io.StringIO())
+        self.assertEqual(RankingRun.objects.count(), 4)
+
+        # Missing scores are recomputed
+        Player.objects.update(score=None, score_raw=None)
+        RankingScore.objects.all().delete()
+        call_command("update_rankings", workers=2, stdout=io.StringIO())
+        self.assertEqual(
+            (
+                list(Player.objects.values_list("name", "score")),
+                list(RankingScore.objects.values_list("player__name", "score")),
+            ),
+            expected,
+        )
+        return
+
+    def test_ranking_hash(self):
+        (A, B, C, D, E, F) = self.players
+        self.create_match([A], [B], (21, 15))
+        views.update_ranking(self.league, self.stage)
+        self.assertEqual(RankingRun.objects.count(), 2)
+
+        # Nothing has changed
+        views.update_ranking(self.league, self.stage)
+        self.assertEqual(RankingRun.objects.count(), 2)
+
+        # Only the league ranking changes
+        m = Match.objects.create(league=self.league)
+        m.home_team.add(C)
+        m.away_team.add(D)
+        Period.objects.create(match=m, home_points=21, away_points=10)
+        views.update_ranking(self.league, self.stage)
+        self.assertEqual(RankingRun.objects.count(), 3)
+        self.assertIsNone(RankingRun.objects.first().stage)
+
+        # Regularisation is part of the input
+        self.league.regularisation = 2
+        self.league.save()
+        views.update_ranking(self.league, self.stage)
+        self.assertEqual(RankingRun.objects.count(), 5)
+
+        # Missing scores are recomputed even if the input hasn't changed
+        RankingScore.objects.all().delete()
+        views.update_ranking(self.league, self.stage)
+        self.assertEqual(RankingRun.objects.count(), 6)
+        self.assertEqual(RankingScore.objects.count(), 2)
+        return
+
+    def test_import_league(self):
+        (A, B, C, D, E, F) = self.players
+        self.create_match([A], [B], (21, 15))
+        views.update_ranking(self.league, self.stage)
+
+        admin = User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(admin)
+        response = self.client.get("/league/test-league/export/")
+        f = io.BytesIO(response.content)
+        f.name = "test-league.json"
+        self.client.post("/import/", dict(slug="imported", file=f))
+
+        league = League.objects.get(slug="imported")
+        # Only the ranking calculation has bumped the revision
+        self.assertEqual(league.revision, 1)
+        self.assertEqual(
+            list(
+                MatchSummary.objects.filter(match__league=league)
+                .values_list("total_home_points", "total_away_points")
+            ),
+            [(21, 15)],
+        )
+        self.assertEqual(
+            sorted(
+                PlayerStats.objects.filter(player__league=league, stage=None)
+                .values_list("player__name", "points_won", "points_lost")
+            ),
+            [("A", 21, 15), ("B", 15, 21)],
+        )
+
+        # The rankings of the imported league are calculated
+        self.assertEqual(
+            sorted(
+                Player.objects.filter(league=league, score__isnull=False)
+                .values_list("name", flat=True)
+            ),
+            ["A", "B"],
+        )
+        self.assertEqual(
+            RankingScore.objects.filter(stage__league=league).count(),
+            2,
+        )
+        return
+
+    @override_settings(RANKING_BACKGROUND=True)
+    def test_ranking_worker(self):
+        (A, B, C, D, E, F) = self.players
+        other = Stage.objects.create(league=self.league, name="Other", slug="other")
+        m = self.create_match([A], [B], (21, 15))
+        views.update_ranking(self.league, self.stage)
+        views.update_ranking(self.league, other)
+        views.update_ranking(self.league)
+
+        # The requests are coalesced and nothing has been calculated yet
+        self.assertEqual(RankingJob.objects.count(), 1)
+        self.assertEqual(set(RankingJob.objects.get().stages.all()), {self.stage, other})
+        self.assertIsNone(Player.objects.get(name="A").score)
+        response = self.client.get("/league/test-league/")
+        self.assertContains(response, "The ranking is being updated")
+
+        call_command("ranking_worker", once=True, stdout=io.StringIO())
+        self.assertEqual(RankingJob.objects.count(), 0)
+        self.assertIsNotNone(Player.objects.get(name="A").score)
+        self.assertEqual(RankingScore.objects.filter(stage=self.stage).count(), 2)
+        self.assertEqual(RankingRun.objects.count(), 3)
+        response = self.client.get("/league/test-league/")
+        self.assertNotContains(response, "The ranking is being updated")
+
+        # A failing job doesn't block the other leagues
+        other_league = League.objects.create(slug="other-league", title="Other League")
+        views.update_ranking(self.league)
+        views.update_ranking(other_league)
+        update = views.update_rankings_batched
+
+        def fail_first(league, stages):
+            if league == self.league:
+                raise ValueError("Broken league")
+            return update(league, stages)
+
+        with mock.patch.object(views, "update_rankings_batched", fail_first):
+            with self.assertLogs(level="ERROR"):
+                call_command("ranking_worker", once=True, stdout=io.StringIO())
+        self.assertEqual(list(RankingJob.objects.values_list("league__slug", flat=True)), ["test-league"])
+        call_command("ranking_worker", once=True, stdout=io.StringIO())
+        self.assertEqual(RankingJob.objects.count(), 0)
+        return
+
+    def test_stage_inclusion(self):
+        (A, B, C, D, E, F) = self.players
+        # Cumulative chain: third includes second includes stage
+        second = Stage.objects.create(league=self.league, name="Second", slug="second")
+        third = Stage.objects.create(league=self.league, name="Third", slug="third")
+        third.included.add(second)
+        second.included.add(self.stage)
+        self.assertEqual(set(third.included_all.all()), {second, self.stage})
+        self.assertEqual(set(self.stage.included_by_all.all()), {second, third})
+
+        m = self.create_match([A], [B], (21, 15))
+        self.assertEqual(list(third.get_matches(user=None)), [m])
+
+        # All the stages including the match are updated in topological order
+        views.update_ranking(self.league, self.stage)
+        self.assertEqual(
+            list(RankingRun.objects.order_by("pk").values_list("stage__slug", flat=True)),
+            [None, "stage", "second", "third"],
+        )
+        self.assertEqual(RankingScore.objects.filter(stage=third).count(), 2)
+
+        # The closure follows the changes
+        second.delete()
+        self.assertEqual(list(third.included_all.all()), [])
+        third.included.set([self.stage])
+        self.assertEqual(list(third.included_all.all()), [self.stage])
+
+        # Cycles are allowed
+        self.assertEqual(
+            models.stage_inclusion_closure({1: [2], 2: [3], 3: [1], 4: []}),
+            {1: {2, 3}, 2: {1, 3}, 3: {1, 2}, 4: set()},
+        )
+        return
+
+    def test_match_summary(self):
+        (A, B, C, D, E, F) = self.players
+        m = Match.objects.create(league=self.league)
+        m.home_team.add(A)
+        m.away_team.add(B)
+        self.assertFalse(MatchSummary.objects.filter(match=m).exists())
+
+        def post_result(periods, initial=[]):
+            m.refresh_from_db()
+            data = {
+                "last_updated_constraint": m.last_updated.isoformat(),
+                "period_set-TOTAL_FORMS": len(initial) + len(periods),
+                "period_set-INITIAL_FORMS": len(initial),
+                "period_set-MIN_NUM_FORMS": 0,
+                "period_set-MAX_NUM_FORMS": 1000,
+            }
+            for (i, (pk, x, y, delete)) in enumerate(initial + periods):
+                data[f"period_set-{i}-id"] = "" if pk is None else pk
+                data[f"period_set-{i}-match"] = m.pk
+                data[f"period_set-{i}-home_points"] = x
+                data[f"period_set-{i}-away_points"] = y
+                if delete:
+                    data[f"period_set-{i}-DELETE"] = "on"
+            response = self.client.post(
+                f"/league/test-league/matches/{m.uuid}/result/",
+                data,
+            )
+            self.assertEqual(response.status_code, 302)
+            return MatchSummary.objects.get(match=m)
+
+        s = post_result([(None, 21, 15, False), (None, 18, 21, False), (None, 21, 19, False)])
+        self.assertEqual(
+            (s.period_count, s.home_periods, s.away_periods),
+            (3, 2, 1),
+        )
+        self.assertEqual((s.total_home_points, s.total_away_points), (60, 55))
+        self.assertEqual((s.max_home_points, s.max_away_points), (21, 21))
+
+        # Edit and delete periods
+        (p1, p2, p3) = Period.objects.filter(match=m).order_by("pk")
+        s = post_result([], initial=[
+            (p1.pk, 21, 15, False),
+            (p2.pk, 10, 21, False),
+            (p3.pk, 21, 19, True),
+        ])
+        self.assertEqual(
+            (s.period_count, s.home_periods, s.away_periods, s.total_home_points),
+            (2, 1, 1, 31),
+        )
+        self.assertEqual(s.datetime_last_period, Period.objects.get(pk=p2.pk).datetime)
+
+        # The summaries can be rebuilt
+        MatchSummary.objects.all().delete()
+        call_command("rebuild_match_summaries", stdout=io.StringIO())
+        self.assertEqual(MatchSummary.objects.get(match=m).total_home_points, 31)
+
+        # Deleting the match deletes its summary
+        m.delete()
+        self.assertEqual(MatchSummary.objects.count(), 0)
+        return
+
+    def test_ranking_positions(self):
+        (A, B, C, D, E, F) = self.players
+        self.create_match([A], [B], (21, 15))
+        self.create_match([B], [C], (21, 15))
+        views.update_ranking(self.league, self.stage)
+        self.assertEqual(
+            list(
+                Player.objects.order_by("name").values_list(
+                    "name",
+                    "ranking_position",
+                    "ranking_count_total",
+                    "ranking_relative_position",
+                )
+            ),
+            [
+                ("A", 1, 3, 100.0),
+                ("B", 2, 3, 50.0),
+                ("C", 3, 3, 0.0),
+                ("D", None, None, None),
+                ("E", None, None, None),
+                ("F", None, None, None),
+            ],
+        )
+        self.assertEqual(
+            list(
+                RankingScore.objects.filter(stage=self.stage).values_list(
+                    "player__name",
+                    "position",
+                    "count_total",
+                )
+            ),
+            [("A", 1, 3), ("B", 2, 3), ("C", 3, 3)],
+        )
+
+        # Updates keep the positions up to date
+        m = self.create_match([C], [A], (21, 0))
+        views.update_ranking(self.league, self.stage)
+        self.assertEqual(
+            Player.objects.get(name="C").ranking_position,
+            1 + Player.objects.filter(score__gt=Player.objects.get(name="C").score).count(),
+        )
+
+        response = self.client.get(f"/league/test-league/players/view/{A.uuid}/")
+        self.assertContains(response, "/ 3")
+        return
+
+    def test_ranking_runs(self):
+        (A, B, C, D, E, F) = self.players
+        self.create_match([A], [B], (21, 15))
+        views.update_ranking(self.league, self.stage)
+        m = self.create_match([A], [C], (21, 15))
+        views.update_ranking(self.league, self.stage)
+
+        self.assertQuerySetEqual(
+            RankingRun.objects.order_by("pk").values_list(
+                "stage", "method", "matches", "players", "rows_changed",
+            ),
+            [
+                (None, "newton", 1, 2, 2),
+                (self.stage.pk, "newton", 1, 2, 2),
+                (None, "newton", 2, 3, 3),
+                (self.stage.pk, "newton", 2, 3, 3),
+            ],
+            transform=tuple,
+        )
+
+        # Admin view shows percentiles
+        admin = User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(admin)
+        response = self.client.get("/admin/leagues/rankingrun/")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Percentiles")
+        self.assertEqual(response.context["statistics_runs"], 4)
+
+        # Old runs are pruned
+        RankingRun.objects.filter(stage=None).update(
+            created_at=timezone.now() - datetime.timedelta(days=40),
+        )
+        call_command("prune_ranking_runs", stdout=io.StringIO())
+        self.assertEqual(RankingRun.objects.count(), 2)
+        call_command("prune_ranking_runs", days=0, stdout=io.StringIO())
+        self.assertEqual(RankingRun.objects.count(), 0)
+        return
+
+
+class TestQueryCounts(TestCase):
+
+    # Upper bounds for the number of queries of each view
+    BUDGETS = dict(
+        league=20,
+        dashboard=25,
+        dashboard_content=25,
+        player=20,
+        stage=30,
+    )
+
+    def setUp(self):
+        # Primary keys are reused between tests, so cached pages would be too
+        cache.clear()
+        return
+
+    def create_league(self, n_matches):
+        league = create_league(n_matches, 12)
+        courts = [
+            Court.objects.create(league=league, name=f"Court {i}")
+            for i in range(2)
+        ]
+        stages = [
+            Stage.objects.create(
+                league=league,
+                name=f"Stage {i}",
+                slug=f"stage-{i}",
+                on_dashboard=True,
+            )
+            for i in range(2)
+        ]
+        matches = list(league.match_set.all())
+        for (i, m) in enumerate(matches):
+            m.court = courts[i % 2]
+            m.stage = stages[i % 2]
+        Match.objects.bulk_update(matches, ["court", "stage"])
+        views.update_ranking(league, *stages)
+        return league
+
+    def count_queries(self, league):
+        player = league.player_set.first()
+        urls = dict(
+            league=f"/league/{league.slug}/",
+            dashboard=f"/league/{league.slug}/dashboard/",
+            dashboard_content=f"/league/{league.slug}/dashboard/content/",
+            player=f"/league/{league.slug}/players/view/{player.uuid}/",
+            stage=f"/league/{league.slug}/stages/view/stage-0/",
+        )
+        counts = {}
+        for (view, url) in urls.items():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts[view] = len(queries)
+        return counts
+
+    def test_query_counts(self):
+        counts = [
+            self.count_queries(self.create_league(n))
+            for n in [10, 100, 1000]
+        ]
+        for (view, budget) in self.BUDGETS.items():
+            self.assertLessEqual(counts[-1][view], budget, view)
+            # The number of queries doesn't grow with the league
+            self.assertEqual(
+                [c[view] for c in counts],
+                [counts[0][view]] * len(counts),
+                view,
+            )
+        return
+
+
+class TestDashboardCache(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.league = League.objects.create(
+            slug="test-league",
+            title="Test League",
+        )
+        (A, B) = [
+            Player.objects.create(league=self.league, name=name)
+            for name in "AB"
+        ]
+        self.match = Match.objects.create(league=self.league)
+        self.match.home_team.add(A)
+        self.match.away_team.add(B)
+        return
+
+    def get_revision(self):
+        return League.objects.get(pk=self.league.pk).revision
+
+    def test_dashboard_cache(self):
+        url = "/league/test-league/dashboard/content/"
+        content = self.client.get(url).content
+        # Served from the cache (the league is read for the ETag and the view)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url).content, content)
+
+        # Writes bump the revision
+        revision = self.get_revision()
+        self.client.get(f"/league/test-league/matches/{self.match.uuid}/start/")
+        self.assertGreater(self.get_revision(), revision)
+        revision = self.get_revision()
+        Period.objects.create(match=self.match, home_points=21, away_points=12)
+        self.assertGreater(self.get_revision(), revision)
+        revision = self.get_revision()
+        views.update_ranking(self.league)
+        self.assertGreater(self.get_revision(), revision)
+
+        # Saving an outdated league instance doesn't revert the revision
+        revision = self.get_revision()
+        self.league.title = "Renamed"
+        self.league.save()
+        self.assertEqual(self.get_revision(), revision + 1)
+
+        response = self.client.get(url)
+        self.assertNotEqual(response.content, content)
+        self.assertContains(response, "21")
+
+        # The cache keys are safe for any cache backend (e.g., memcached)
+        for user in [None, "admin", Player.objects.first().uuid]:
+            self.assertRegex(views.league_version(self.league, user), r"^[0-9a-f]{64}$")
+        return
+
+    def test_conditional_get(self):
+        Stage.objects.create(league=self.league, name="Stage", slug="stage")
+        for url in [
+                "/league/test-league/",
+                "/league/test-league/stages/view/stage/",
+                "/league/test-league/dashboard/content/",
+        ]:
+            etag = self.client.get(url)["ETag"]
+            # Only the league is read if nothing has changed
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+            Period.objects.create(match=self.match, home_points=21, away_points=12)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+
+        self.assertEqual(self.client.get("/league/no-league/").status_code, 404)
+        return
@@ -1,28 +1,34 @@
-import functools
-from itertools import cycle, chain, repeat, count
+from itertools import cycle, count, compress
 import logging
+import hashlib
+import json
 import datetime
 import time
 from argparse import Namespace
+from concurrent.futures.process import BrokenProcessPool
 import re
 import numpy as np
 
 from django.shortcuts import render, get_object_or_404
+from django.template.loader import render_to_string
+from django.core.cache import cache
+from django.views.decorators.http import condition
 from django import http
 from django.urls import reverse
 from django.forms import inlineformset_factory, formset_factory
 from django.conf import settings
-from django.db.models import Q, Count
+from django.db.models import Q, F, Count
 from django.core import exceptions
 from django.core.exceptions import PermissionDenied, MultipleObjectsReturned
-from django.db import IntegrityError
-from django.db.models.functions import Now
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Now, Coalesce
 from django.core import serializers
 
 from . import models
 from . import forms
 from . import ranking
 from . import tournament
+from . import pool
 
 
 def is_admin(league, request):
@@ -184,11 +190,43 @@ def get_user_banner_matches(matches, league, user):
     )
 
 
+def league_version(league, user):
+    """Identifier of the contents of the league pages shown to the user
+
+    The pages depend on the user because of the permissions, and on the date
+    because the match times show the date unless it's today. The identifier
+    is a hash, so it can be used in cache keys and ETags as is.
+
+    """
+    # The user is "admin", a player UUID or None
+    return hashlib.sha256(
+        f"{league.pk}:{league.revision}:{user}:{datetime.date.today()}".encode()
+    ).hexdigest()
+
+
+def league_etag(request, league_slug, **kwargs):
+    """ETag of a league page from the league revision
+
+    Used with the `condition` decorator, so unchanged pages are answered with
+    304 Not Modified after one lookup of the league without running the match
+    queries.
+
+    """
+    try:
+        league = models.League.objects.get(slug=league_slug)
+    except models.League.DoesNotExist:
+        return None
+    return league_version(league, get_user(league, request))
+
+
+@condition(etag_func=league_etag)
 def view_league(request, league_slug):
     league = get_object_or_404(models.League, slug=league_slug)
     user = get_user(league, request)
     next_up = league.next_up_matches()
-    matches = league.match_set.with_total_points(user=user, next_up=next_up)
+    matches = models.with_table_relations(
+        league.match_set.with_total_points(user=user, next_up=next_up)
+    )
     return render(
         request,
         "leagues/view_league.html",
@@ -204,7 +242,7 @@ def view_league(request, league_slug):
             user_player=user,
             can_administrate=can_administrate(league, user),
             **get_user_banner_matches(matches, league, user),
-            **models.group_matches(matches),
+            **models.group_matches(models.attach_match_stats(matches)),
         )
     )
 
@@ -325,13 +363,11 @@ def edit_league(request, league_slug):
     )
 
 
-def view_dashboard(request, league_slug, template="leagues/view_dashboard.html"):
-    league = get_object_or_404(models.League, slug=league_slug)
-    user = get_user(league, request)
+def dashboard_context(league, user):
     next_up = league.next_up_matches()
     stages = league.stage_set.filter(on_dashboard=True)
     rankings = [
-        (stage.name, stage.rankingscore_set.all())
+        (stage.name, stage.rankingscore_set.select_related("player"))
         for stage in stages
     ]
     if len(rankings) == 0:
@@ -349,36 +385,62 @@ def view_dashboard(request, league_slug, template="leagues/view_dashboard.html")
             )
         ]
 
-    return render(
-        request,
-        template,
-        dict(
-            league=league,
-            next_matches=league.match_set.with_total_points(next_up=next_up, user=user).filter(
+    return dict(
+        league=league,
+        next_matches=models.with_table_relations(
+            league.match_set.with_total_points(next_up=next_up, user=user).filter(
                 can_start=True,
-            ).order_by("court", "order", "pk"),
-            ongoing_matches=league.match_set.with_total_points(user=user, next_up=None).filter(
+            ).order_by("court", "order", "pk")
+        ),
+        ongoing_matches=models.with_table_relations(
+            league.match_set.with_total_points(user=user, next_up=None).filter(
                 period_count=0,
                 datetime_started__isnull=False,
-            ).order_by("court", "-datetime_started"),
-            latest_matches=league.match_set.with_total_points(user=user, next_up=None).filter(
+            ).order_by("court", "-datetime_started")
+        ),
+        latest_matches=models.with_table_relations(
+            league.match_set.with_total_points(user=user, next_up=None).filter(
                 period_count__gt=0,
-            ).order_by("-datetime_last_period")[:league.latest_matches_count],
-            ranking=rankings,
-            user_player=user,
-            can_administrate=can_administrate(league, user),
-        )
+            ).order_by("-datetime_last_period")[:league.latest_matches_count]
+        ),
+        ranking=rankings,
+        user_player=user,
+        can_administrate=can_administrate(league, user),
     )
 
 
-def get_dashboard_content(request, league_slug):
-    return view_dashboard(
+def view_dashboard(request, league_slug):
+    league = get_object_or_404(models.League, slug=league_slug)
+    user = get_user(league, request)
+    return render(
         request,
-        league_slug,
-        template="leagues/dashboard_content.html",
+        "leagues/view_dashboard.html",
+        dashboard_context(league, user),
     )
 
 
+@condition(etag_func=league_etag)
+def get_dashboard_content(request, league_slug):
+    """Dashboard content for refreshing the dashboard page
+
+    Dashboards poll the content every few seconds, so the rendered content is
+    cached until the league revision changes (see `league_version`).
+
+    """
+    league = get_object_or_404(models.League, slug=league_slug)
+    user = get_user(league, request)
+    key = f"dashboard:{league_version(league, user)}"
+    content = cache.get(key)
+    if content is None:
+        content = render_to_string(
+            "leagues/dashboard_content.html",
+            dashboard_context(league, user),
+            request=request,
+        )
+        cache.set(key, content, settings.DASHBOARD_CACHE_TIMEOUT)
+    return http.HttpResponse(content)
+
+
 def view_stats(request, league_slug):
     league = get_object_or_404(models.League, slug=league_slug)
     user = get_user(league, request)
@@ -399,10 +461,12 @@ def view_player(request, league_slug, player_uuid):
     player = get_object_or_404(models.Player, league__slug=league_slug, uuid=player_uuid)
     user = get_user(player.league, request)
     next_up = player.league.next_up_matches()
-    matches = player.league.match_set.with_total_points(
-        user=user,
-        next_up=next_up,
-        player=player,
+    matches = models.with_table_relations(
+        player.league.match_set.with_total_points(
+            user=user,
+            next_up=next_up,
+            player=player,
+        )
     )
     return render(
         request,
@@ -415,8 +479,10 @@ def view_player(request, league_slug, player_uuid):
                 league=player.league,
                 user=user,
             ),
-            **models.group_matches(matches),
-            ranking_stats=models.RankingScore.objects.with_ranking_stats(player),
+            **models.group_matches(models.attach_match_stats(matches)),
+            ranking_stats=models.RankingScore.objects.with_ranking_stats(
+                player
+            ).select_related("stage__league"),
             user_player=user,
             can_administrate=can_administrate(player.league, user),
         )
@@ -504,136 +570,437 @@ def delete_player(request, league_slug, player_uuid):
         ),
     )
 
-def calculate_ranking(matches, regularisation, initial=dict()):
-    # FIXME: One should be able to avoid reading Player table because we only
-    # need some keys to identify the players and such keys should be in Match
-    # table already. Then, remove prefetch_related.
-    ps = list(
-        functools.reduce(
-            lambda acc, m: acc.union(
-                set(m.home_team.all())
-            ).union(
-                set(m.away_team.all())
-            ),
-            matches,
-            set(),
+def load_ranking_matches(matches):
+    """Read the teams and the results of the matches as index arrays
+
+    The rows of the team tables and the match results are read with
+    `values_list` straight into NumPy arrays, so no model instances are
+    created. Returns the primary keys of the players in the matches (also in
+    the matches without results) and the results in the format used by
+    `ranking.calculate_ranking`, the players being indices to the primary keys.
+
+    """
+    results = np.array(
+        matches.filter(
+            summary__total_home_points__isnull=False,
+        ).annotate(
+            bonus=Coalesce("stage__bonus", "league__bonus"),
+        ).values_list(
+            "pk",
+            "summary__total_home_points",
+            "summary__total_away_points",
+            F("bonus") * F("summary__home_periods"),
+            F("bonus") * F("summary__away_periods"),
+        ).order_by("pk"),
+        dtype=np.int64,
+    ).reshape((-1, 5))
+    teams = [
+        np.array(
+            Team.objects.filter(
+                match__in=matches.values("pk"),
+            ).values_list("match_id", "player_id"),
+            dtype=np.int64,
+        ).reshape((-1, 2))
+        for Team in [models.HomeTeamPlayer, models.AwayTeamPlayer]
+    ]
+    (players, index) = np.unique(
+        np.concatenate([team[:, 1] for team in teams]),
+        return_inverse=True,
+    )
+
+    def split_teams(team, index):
+        # Group the players by the matches that have a result
+        has_result = np.isin(team[:, 0], results[:, 0])
+        (match_ids, index) = (team[has_result, 0], index[has_result])
+        order = np.argsort(match_ids, kind="stable")
+        (match_ids, index) = (match_ids[order], index[order])
+        return np.split(index, np.searchsorted(match_ids, results[1:, 0]))
+
+    home = split_teams(teams[0], index[:len(teams[0])])
+    away = split_teams(teams[1], index[len(teams[0]):])
+    X = [
+        (h.tolist(), a.tolist(), int(k_home + bonus_home), int(k_away + bonus_away))
+        for (h, a, (_, k_home, k_away, bonus_home, bonus_away))
+        in zip(home, away, results)
+    ]
+    return (players.tolist(), X)
+
+
+def ranking_problem(matches, initial):
+    """Form the input for ranking calculations from the matches
+
+    Returns the primary keys of the players, the match results and the initial
+    raw scores in the format used by `ranking.calculate_ranking`. ``initial``
+    maps the primary keys of the players to the initial raw scores.
+
+    """
+    (ps, X) = load_ranking_matches(matches)
+    r0 = [
+        np.nan if initial.get(p) is None else initial[p]
+        for p in ps
+    ]
+    return (ps, X, r0)
+
+
+def ranking_hash(ps, X, regularisation):
+    """Content hash of a ranking problem (see `ranking_problem`)
+
+    The hash doesn't depend on the order of the players or the matches, so
+    identical inputs give identical hashes across processes.
+
+    """
+    matches = sorted(
+        (
+            sorted(ps[i] for i in home),
+            sorted(ps[i] for i in away),
+            k_home,
+            k_away,
         )
+        for (home, away, k_home, k_away) in X
     )
-    p2id = {
-        p.uuid: i
-        for (i, p) in enumerate(ps)
-    }
-    r0 = list(map(
-        lambda r: np.nan if r is None else r,
-        [initial.get(p.uuid) for p in ps]
-    ))
-    (rs, raws) = ranking.calculate_ranking(
-        [
-            (
-                # FIXME: One should be able to avoid reading Player table
-                # because we only need some keys to identify the players and
-                # such keys should be in Match table already. Then, remove
-                # prefetch_related.
-                [p2id[p.uuid] for p in m.home_team.all()],
-                [p2id[p.uuid] for p in m.away_team.all()],
-                m.total_home_points + m.home_bonus,
-                m.total_away_points + m.away_bonus,
-            )
-            for m in matches
-            if m.total_home_points is not None
-        ],
-        len(p2id),
+    return hashlib.sha256(
+        json.dumps([matches, float(regularisation)]).encode()
+    ).hexdigest()
+
+
+def ranking_stored(X, r0):
+    """Whether all the players with results have stored raw scores
+
+    ``X`` and ``r0`` are from `ranking_problem`.
+
+    """
+    return not any(
+        np.isnan(r0[i])
+        for (home, away, _, _) in X
+        for i in home + away
+    )
+
+
+def calculate_ranking(matches, regularisation, initial=dict()):
+    """Calculate the ranking from the matches
+
+    ``initial`` maps the primary keys of the players to the initial raw scores.
+
+    Returns the players, the scores, the raw scores, the summary and the hash
+    of the input (see `ranking_hash`).
+
+    """
+    (ps, X, r0) = ranking_problem(matches, initial)
+    (rs, raws, info) = ranking.calculate_ranking(
+        X,
+        len(ps),
         regularisation,
         initial=r0,
     )
-    return (ps, rs, raws)
+    return (ps, rs, raws, info, ranking_hash(ps, X, regularisation))
 
 
-def update_league_ranking(league):
-    ms = (
-        models.Match.objects.with_total_points(user=None, next_up=None)
-        .prefetch_related("home_team")
-        .prefetch_related("away_team")
-        .filter(league=league)
+def get_league_matches(league):
+    return models.Match.objects.filter(league=league)
+
+
+def get_stage_matches(stage):
+    return models.Match.objects.filter(
+        Q(stage=stage) |
+        Q(stage__in=stage.included_all.all())
     )
-    (ps, rs, raws) = calculate_ranking(
-        ms,
+
+
+def ranking_row_changed(previous, new):
+    """Whether a stored ranking row needs to be written
+
+    The rows start with the score and the raw score, which are compared with
+    the ``RANKING_SCORE_TOLERANCE`` setting, and the rest (the positions) are
+    compared exactly.
+
+    """
+    tolerance = settings.RANKING_SCORE_TOLERANCE
+    return previous is None or any(
+        (old is None) != (value is None) or
+        (old is not None and abs(old - value) > tolerance)
+        for (old, value) in zip(previous[:2], new[:2])
+    ) or tuple(previous[2:]) != tuple(new[2:])
+
+
+def save_league_ranking(players, ps, rs, raws):
+    """Write the changed league ranking scores of the players
+
+    Returns the number of players written.
+
+    """
+    fields = [
+        "score",
+        "score_raw",
+        "ranking_position",
+        "ranking_position_tied",
+        "ranking_count_total",
+        "ranking_relative_position",
+    ]
+    # Find ranking scores for each player in the league (or null if not found)
+    prs = dict(zip(ps, rs))
+    praws = dict(zip(ps, raws))
+    positions = ranking.ranking_positions([prs.get(p.pk, None) for p in players])
+    changed = []
+    for (p, position) in zip(players, positions):
+        row = (prs.get(p.pk, None), praws.get(p.pk, None)) + (
+            (None, False, None, None) if position is None else position
+        )
+        if ranking_row_changed([getattr(p, f) for f in fields], row):
+            for (f, value) in zip(fields, row):
+                setattr(p, f, value)
+            changed.append(p)
+    # Update the database
+    with transaction.atomic():
+        models.Player.objects.bulk_update(changed, fields)
+    return len(changed)
+
+
+def save_stage_ranking(stage, ps, rs, raws):
+    """Write the changes of the stage ranking to the database
+
+    The changed and the new ranking scores are upserted and the scores of the
+    players who are no longer in the ranking are deleted. Unchanged scores
+    aren't written at all. Returns the number of rows written or deleted.
+
+    """
+    fields = [
+        "score",
+        "score_raw",
+        "position",
+        "position_tied",
+        "count_total",
+        "relative_position",
+    ]
+    rows = {
+        p: (r, raw) + ((None, False, None, None) if position is None else position)
+        for (p, r, raw, position) in zip(ps, rs, raws, ranking.ranking_positions(rs))
+    }
+    with transaction.atomic():
+        previous = {
+            p: values
+            for (p, *values) in models.RankingScore.objects.filter(
+                stage=stage,
+            ).values_list("player_id", *fields)
+        }
+        removed = [p for p in previous if p not in rows]
+        if len(removed) > 0:
+            models.RankingScore.objects.filter(stage=stage, player_id__in=removed).delete()
+        changed = [
+            models.RankingScore(stage=stage, player_id=p, **dict(zip(fields, values)))
+            for (p, values) in rows.items()
+            if ranking_row_changed(previous.get(p), values)
+        ]
+        models.RankingScore.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=["stage", "player"],
+            update_fields=fields,
+        )
+    return len(removed) + len(changed)
+
+
+def update_league_ranking(league):
+    players = list(models.Player.objects.filter(league=league))
+    (ps, rs, raws, info, h) = calculate_ranking(
+        get_league_matches(league),
         league.regularisation,
         initial={
-            p.uuid: p.score_raw
-            for p in models.Player.objects.filter(league=league)
+            p.pk: p.score_raw
+            for p in players
         },
     )
-
-    # Find ranking scores for each player in the league
-    prs = {p.uuid: r for (p, r) in zip(ps, rs)}
-    praws = {p.uuid: raw for (p, raw) in zip(ps, raws)}
-    players = models.Player.objects.filter(league=league)
-    for p in players:
-        # Update the score (if found) or set to null
-        p.score = prs.get(p.uuid, None)
-        p.score_raw = praws.get(p.uuid, None)
-    # Update the database
-    models.Player.objects.bulk_update(players, ["score", "score_raw"])
+    rows_changed = save_league_ranking(players, ps, rs, raws)
+    record_ranking_runs(league, [None], [info], [rows_changed])
+    models.bump_revision(pk=league.pk)
+    save_ranking_hashes(league, [None], [h])
     return
 
 
 def update_stage_ranking(stage, regularisation):
     if stage is None:
         return
-    # Matches contained in the stage
-    ms = (
-        stage
-        .get_matches(user=None)
-        .prefetch_related("home_team")
-        .prefetch_related("away_team")
-    )
-    (ps, rs, raws) = calculate_ranking(
-        ms,
+    (ps, rs, raws, info, h) = calculate_ranking(
+        get_stage_matches(stage),
         regularisation,
-        initial={
-            r.player.uuid: r.score_raw
-            for r in models.RankingScore.objects.filter(stage=stage)
-        },
+        initial=dict(
+            models.RankingScore.objects.filter(
+                stage=stage,
+            ).values_list("player_id", "score_raw")
+        ),
     )
+    rows_changed = save_stage_ranking(stage, ps, rs, raws)
+    record_ranking_runs(stage.league, [stage], [info], [rows_changed])
+    models.bump_revision(pk=stage.league_id)
+    save_ranking_hashes(stage.league, [stage], [h])
+    return
 
-    # NOTE: Perhaps deletion and creation could be combined by using bulk_create
-    # with update_conflicts and update_fields. However, we would still need to
-    # delete ranking scores that shouldn't exist anymore (e.g., a player was
-    # removed from all matches of the stage).
 
-    # Delete existing ranking
-    models.RankingScore.objects.filter(stage=stage).delete()
+def record_ranking_runs(league, stages, infos, rows_changed):
+    """Store the summaries of ranking calculations
 
-    # Create new ranking
-    models.RankingScore.objects.bulk_create(
-        [
-            models.RankingScore(
-                stage=stage,
-                player=p,
-                score=r,
-                score_raw=raw,
-            )
-            for (p, r, raw) in zip(ps, rs, raws)
-        ]
+    ``stages`` contains None for the league ranking and ``rows_changed`` the
+    numbers of ranking rows written for each ranking.
+
+    """
+    models.RankingRun.objects.bulk_create([
+        models.RankingRun(league=league, stage=stage, rows_changed=n, **info)
+        for (stage, info, n) in zip(stages, infos, rows_changed)
+    ])
+    return
+
+
+def save_ranking_hashes(league, stages, hashes):
+    """Store the input hashes of the rankings
+
+    ``stages`` contains None for the league ranking.
+
+    """
+    for (stage, h) in zip(stages, hashes):
+        obj = league if stage is None else stage
+        obj.ranking_hash = h
+        type(obj).objects.filter(pk=obj.pk).update(ranking_hash=h)
+    return
+
+
+def load_rankings(league, stages, force=False):
+    """Load the league and the stage ranking problems from the database
+
+    Returns the players of the league, the rankings to update (None for the
+    league ranking), their problems (see `ranking_problem`) and the hashes of
+    the problems. Unless ``force``, rankings whose input hasn't changed since
+    the previous calculation, and whose scores are stored, are left out.
+
+    """
+    players = list(models.Player.objects.filter(league=league))
+    stages = [None] + list(stages)
+    problems = [
+        ranking_problem(
+            get_league_matches(league),
+            {p.pk: p.score_raw for p in players},
+        ) if stage is None else
+        ranking_problem(
+            get_stage_matches(stage),
+            dict(
+                models.RankingScore.objects.filter(stage=stage)
+                .values_list("player_id", "score_raw")
+            ),
+        )
+        for stage in stages
+    ]
+    hashes = [
+        ranking_hash(ps, X, league.regularisation)
+        for (ps, X, _) in problems
+    ]
+    changed = [
+        force or
+        h != (league if stage is None else stage).ranking_hash or
+        not ranking_stored(X, r0)
+        for (stage, (_, X, r0), h) in zip(stages, problems, hashes)
+    ]
+    return (
+        players,
+        list(compress(stages, changed)),
+        list(compress(problems, changed)),
+        list(compress(hashes, changed)),
     )
 
+
+def save_rankings(league, players, stages, problems, results, hashes):
+    """Save the results of `load_rankings` problems in one transaction"""
+    with transaction.atomic():
+        rows_changed = [
+            save_league_ranking(players, ps, rs, raws) if stage is None else
+            save_stage_ranking(stage, ps, rs, raws)
+            for (stage, (ps, _, _), (rs, raws, _)) in zip(stages, problems, results)
+        ]
+        record_ranking_runs(
+            league,
+            stages,
+            [info for (_, _, info) in results],
+            rows_changed,
+        )
+        save_ranking_hashes(league, stages, hashes)
+        # The ranking writes are bulk operations which don't send signals
+        models.bump_revision(pk=league.pk)
+    return
+
+
+def update_rankings_batched(league, stages):
+    """Recompute the league ranking and the given stage rankings
+
+    Rankings whose input hasn't changed are skipped. The rest are fitted in one
+    batch, with the player groups in parallel in separate processes if a
+    process pool has been configured (``RANKING_WORKERS`` setting).
+
+    """
+    (players, stages, problems, hashes) = load_rankings(league, stages)
+    if len(problems) == 0:
+        return
+    # The player groups are fitted in parallel if there's a process pool. Only
+    # plain data is sent to the worker processes.
+    problems_data = [(X, len(ps), r0) for (ps, X, r0) in problems]
+    try:
+        results = ranking.calculate_rankings(
+            problems_data,
+            league.regularisation,
+            executor=pool.get_executor(),
+        )
+    except BrokenProcessPool:
+        # A worker process has died (e.g., killed because of running out of
+        # memory). Replace the pool and try once more.
+        logging.warning("The ranking process pool is broken, restarting it")
+        pool.reset_executor()
+        results = ranking.calculate_rankings(
+            problems_data,
+            league.regularisation,
+            executor=pool.get_executor(),
+        )
+    save_rankings(league, players, stages, problems, results, hashes)
+    return
+
+
+def process_ranking_job(job):
+    """Recompute the rankings of a background job
+
+    The job is removed unless it was requested again during the calculation.
+
+    """
+    requested_at = job.requested_at
+    update_rankings_batched(job.league, list(job.stages.all()))
+    if models.RankingJob.objects.filter(pk=job.pk, requested_at=requested_at).delete()[0] > 0:
+        # The pages don't show that the ranking is being updated anymore
+        models.bump_revision(pk=job.league_id)
     return
 
 
 def update_ranking(league, *stages, redirect=None):
-    update_league_ranking(league)
-    stages = set(stages).union(
-        set([
-            s
-            for stage in stages
-            if stage is not None
-            for s in stage.stage_set.all()
-        ])
+    """Update the league ranking and the rankings of the given stages
+
+    The rankings are recomputed in one batch starting from the stored raw
+    scores, so adding a result only needs a few iterations.
+
+    With ``RANKING_BACKGROUND`` setting, the rankings are only marked to be
+    recomputed by the background worker (see `process_ranking_job`).
+
+    """
+    # All the stages that include the given stages directly or indirectly. A
+    # stage includes strictly more stages than the stages it includes, so
+    # sorting by that number gives a topological order.
+    pks = [s.pk for s in stages if s is not None]
+    affected = models.Stage.objects.filter(
+        Q(pk__in=pks) | Q(included_all__in=pks)
+    ).values("pk")
+    stages = list(
+        models.Stage.objects.filter(pk__in=affected).annotate(
+            included_count=Count("included_all", distinct=True),
+        ).order_by("included_count", "pk")
     )
 
-    for stage in stages:
-        update_stage_ranking(stage, league.regularisation)
+    if settings.RANKING_BACKGROUND:
+        models.RankingJob.objects.request(league, stages)
+    else:
+        update_rankings_batched(league, stages)
+
     return redirect if redirect is not None else reverse(
         "view_league",
         args=[league.slug],
@@ -720,6 +1087,7 @@ def delete_stage(request, league_slug, stage_slug):
             ),
         )
 
+@condition(etag_func=league_etag)
 def view_stage(request, league_slug, stage_slug):
     stage = get_object_or_404(
         models.Stage,
@@ -728,17 +1096,20 @@ def view_stage(request, league_slug, stage_slug):
     )
     user = get_user(stage.league, request)
     next_up = stage.league.next_up_matches()
-    matches = stage.get_matches(user=user, next_up=next_up)
+    matches = models.with_table_relations(
+        stage.get_matches(user=user, next_up=next_up)
+    )
     return render(
         request,
         "leagues/view_stage.html",
         dict(
             league=stage.league,
             stage=stage,
+            ranking=stage.rankingscore_set.select_related("player"),
             user_player=user,
             can_administrate=can_administrate(stage.league, user),
             **get_user_banner_matches(matches, stage.league, user),
-            **models.group_matches(matches),
+            **models.group_matches(models.attach_match_stats(matches)),
         )
     )
 
@@ -1715,6 +2086,8 @@ def start_match(request, league_slug, match_uuid):
         m = m.filter(Q(home_team__uuid=user) | Q(away_team__uuid=user))
 
     m.update(datetime_started=Now())
+    # Queryset updates don't send signals
+    models.bump_revision(pk=league.pk)
 
     # Go back to where you came from
     return http.HttpResponseRedirect(
@@ -1738,6 +2111,8 @@ def cancel_start_match(request, league_slug, match_uuid):
         m = m.filter(Q(home_team__uuid=user) | Q(away_team__uuid=user))
 
     m.update(datetime_started=None)
+    # Queryset updates don't send signals
+    models.bump_revision(pk=league.pk)
 
     # Go back to where you came from
     return http.HttpResponseRedirect(
@@ -2017,6 +2392,12 @@ def import_league(request):
 
                     if isinstance(obj.object, models.League):
                         obj.object.slug = slug
+                        obj.object.revision = 0
+
+                    # The rankings of the imported league haven't been
+                    # calculated yet
+                    if isinstance(obj.object, (models.League, models.Stage)):
+                        obj.object.ranking_hash = ""
 
                     obj.save()
                     if obj.deferred_fields is not None:
@@ -2027,8 +2408,14 @@ def import_league(request):
             finally:
                 models.LEAGUE_SLUG.reset(token)
 
-            # Update rankings
+            # The signals skip the raw saves, so rebuild the derived data
             league = models.League.objects.get(slug=slug)
+            models.rebuild_match_summaries(league.match_set.all())
+            models.refresh_player_stats(
+                league.player_set.values_list("pk", flat=True)
+            )
+
+            # Update rankings
             update_ranking(league, *models.Stage.objects.filter(league=league))
             return http.HttpResponseRedirect(
                 reverse(
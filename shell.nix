@@ -41,7 +41,6 @@ mkShell {
           build
           numpy
           scipy
-          autograd
           ipython
           django
           django-ordered-model
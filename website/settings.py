@@ -107,6 +107,19 @@ DATABASES = json_settings.get(
     }
 )
 
+CACHES = json_settings.get(
+    "CACHES",
+    {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+)
+
+# Seconds to keep rendered dashboard contents in the cache. The contents are
+# cached by the league revision, so this only limits the memory usage.
+DASHBOARD_CACHE_TIMEOUT = json_settings.get("DASHBOARD_CACHE_TIMEOUT", 600)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -153,6 +166,21 @@ STATIC_ROOT = json_settings.get("STATIC_ROOT", "static/")
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Number of worker processes for the ranking calculations. Zero calculates the
+# rankings in the request process.
+RANKING_WORKERS = json_settings.get("RANKING_WORKERS", 0)
+
+# Recompute the rankings in the background (ranking_worker management command)
+# instead of in the request that changed them
+RANKING_BACKGROUND = json_settings.get("RANKING_BACKGROUND", False)
+
+# Ranking scores that change less than this aren't written to the database
+RANKING_SCORE_TOLERANCE = json_settings.get("RANKING_SCORE_TOLERANCE", 1e-6)
+
+# Ranking calculation telemetry older than this many days is removed by the
+# prune_ranking_runs management command
+RANKING_RUN_RETENTION_DAYS = json_settings.get("RANKING_RUN_RETENTION_DAYS", 30)
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,